@@ -10,7 +10,7 @@ def get_handle():
     Returns:
         _type_: _description_
     """
-    if True:
+    if hasattr(ctypes, 'windll'):
 
         handle = ctypes.windll.user32.FindWindowW(None, exe_name)
         if handle != 0:
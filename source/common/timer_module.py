@@ -3,6 +3,9 @@ from asyncio.log import logger
 
 
 import pytz, datetime
+import bisect
+import math
+import threading
 
 from functools import wraps
 
@@ -240,6 +243,76 @@ class Performance(Timer):
         else:
             self.reset_and_get()
 
+class Histogram:
+    """对数分桶直方图，常开的低开销延迟统计。
+
+    Args:
+        min_value (float): 第一个桶的上界. Defaults to 1e-6.
+        max_value (float): 最后一个有界桶的上界，更大的值落入溢出桶. Defaults to 10.
+        buckets_per_decade (int): 每10倍区间的桶数. Defaults to 10.
+    """
+    def __init__(self, min_value=1e-6, max_value=10, buckets_per_decade=10):
+        n = int(round(math.log10(max_value / min_value) * buckets_per_decade))
+        self.bounds = [min_value * 10 ** (i / buckets_per_decade) for i in range(n + 1)]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.
+            self.min = None
+            self.max = None
+
+    def record(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        """第p百分位数所在桶的上界，溢出桶返回最大值。
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            target = self.count * p / 100
+            acc = 0
+            for i, c in enumerate(self.counts):
+                acc += c
+                if acc >= target and c > 0:
+                    return self.bounds[i] if i < len(self.bounds) else self.max
+            return self.max
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: count, mean, min, max, p50, p90, p99, buckets({上界: 数量})
+        """
+        p50, p90, p99 = self.percentile(50), self.percentile(90), self.percentile(99)
+        with self.lock:
+            buckets = {}
+            for i, c in enumerate(self.counts):
+                if c:
+                    buckets[self.bounds[i] if i < len(self.bounds) else float('inf')] = c
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+                'p50': p50,
+                'p90': p90,
+                'p99': p99,
+                'buckets': buckets,
+            }
+
+
 def timer(function):
     @wraps(function)
     def function_timer(*args, **kwargs):
@@ -1,30 +1,112 @@
+import collections
 import threading
 from ctypes.wintypes import RECT
 
-import pyautogui
-import win32api
-import win32print
 from numpy import ndarray
 
 from source.common import static_lib
 from source.common import timer_module
+from source.interaction.capture_rate import CaptureRateController
+from source.interaction.capture_stats import CaptureStats
+from source.interaction.frame import Frame, FrameRing, RegionFrame
+from source.interaction.frame_pool import FramePool, PooledBuffer
+from source.interaction.frame_recorder import FrameRecorder, FrameReader
 from source.util import *
 from source.util import np
 
+try:
+    import win32api
+    import win32print
+except ImportError:
+    win32api = None
+    win32print = None
+
+
+class CAPTURE_BACKEND_NOT_FOUND(Exception): pass
+
+
+# 截图后端注册表 name -> Capture子类
+CAPTURE_BACKENDS = {}
+
+
+def register_capture(name: str):
+    """注册截图后端的装饰器。
+
+    Args:
+        name (str): 后端名称，供get_capture使用。
+    """
+
+    def wrapper(cls):
+        CAPTURE_BACKENDS[name] = cls
+        cls.backend_name = name
+        return cls
+
+    return wrapper
+
+
+def get_capture(name='windows', **kwargs):
+    """按名称创建截图后端。
+
+    Args:
+        name (str, optional): 已注册的后端名称. Defaults to 'windows'.
+        **kwargs: 传给后端构造函数的参数。
+
+    Raises:
+        CAPTURE_BACKEND_NOT_FOUND: 后端未注册。
+
+    Returns:
+        Capture: 截图对象
+    """
+    if name not in CAPTURE_BACKENDS:
+        raise CAPTURE_BACKEND_NOT_FOUND(f"{name}, registered: {list(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[name](**kwargs)
+
 
 # 基本拍摄类
 class Capture():
+    backend_name = None
+    # 后端是否实现了_get_capture_roi，可以只截取部分区域
+    support_roi = False
+
     def __init__(self):
-        self.capture_cache = np.zeros_like((1080, 1920, 3), dtype="uint8")
+        self.capture_cache = np.zeros((1080, 1920, 4), dtype="uint8")
+        # 截图写入缓冲池中复用的内存，last_frame持有当前帧缓冲区的引用
+        self.frame_pool = FramePool()
+        self.last_frame = None
+        # 最近一个整帧的编号。整帧与区域截图帧(RegionFrame)共用_frame_seq编号序列
+        self.frame_id = 0
+        self._frame_seq = 0
+        self._frame_seq_lock = threading.Lock()
+        # 当前截图间隔内的区域截图帧
+        self.region_frame = None
+        self.region_frame_lock = threading.Lock()
+        # 最近的几帧，供latest/next_after/wait_for_new使用
+        self.frame_ring = FrameRing()
         self.max_fps = 180
         self.fps_timer = timer_module.Timer(diff_start_time=1)
         self.capture_cache_lock = threading.Lock()
+        # 截图时持有grab_lock，capture_cache_lock只在交换当前帧时短暂持有
+        self.grab_lock = threading.Lock()
+        self.producer_thread = None
+        self.producer_stop_event = threading.Event()
+        self.producer_wake_event = threading.Event()
+        # 自适应帧率，为None时使用固定的max_fps
+        self.rate_controller = None
+        self.recorder = None
+        # 各帧的分块校验和，frame_id -> signature，用于判断区域是否变化
+        self.tile_size = 40
+        self.tile_history = collections.OrderedDict()
+        self.tile_history_size = 64
+        self.tile_history_lock = threading.Lock()
         self.capture_times = 0
-        self.cap_per_sec = timer_module.CyclicCounter(limit=3).start()
-        self.last_cap_times = 0
+        # 常开的截图统计，见CaptureStats.snapshot
+        self.stats = CaptureStats()
 
     # 图片数组私有化
-    def _cover_privacy(self, img: ndarray) -> ndarray:
+    def _cover_privacy(self, img: ndarray, origin=(0, 0)) -> ndarray:
+        """
+        origin: img左上角在客户区中的坐标，截取部分区域时使用
+        """
         return img
 
     # 定义一个空方法获取图片
@@ -33,6 +115,23 @@ class Capture():
         需要根据不同设备实现该函数。
         """
 
+    def _get_capture_buffer(self) -> PooledBuffer:
+        """
+        获取一帧并写入缓冲池中的缓冲区。默认拷贝_get_capture的结果，
+        后端可以重写该函数直接写入缓冲区，做到稳定截图时零分配。
+        """
+        img = self._get_capture()
+        if img is None:
+            return None
+        buf = self.frame_pool.get(img.shape, img.dtype)
+        np.copyto(buf.array, img)
+        return buf
+
+    def _get_capture_roi(self, posi) -> np.ndarray:
+        """
+        只截取区域posi([x1,y1,x2,y2])，support_roi为True的后端需要实现该函数。
+        """
+
     # 检查图片的长宽高是否是规定的
     def _check_shape(self, img: np.ndarray):
         if img is None:
@@ -44,69 +143,387 @@ class Capture():
             return False
 
     # 真实捕获操作
-    def capture(self, is_next_img=False) -> np.ndarray:
+    def capture(self, is_next_img=False, as_frame=False):
         """
         is_next_img: 强制截取下一张图片
+        as_frame: 返回共享的只读Frame而不是拷贝的数组
         """
-        if DEBUG_MODE:
-            r = self.cap_per_sec.count_times()
-            if r:
-                if r != self.last_cap_times:
-                    logger.trace(f"capps: {r / 3}")
-                    self.last_cap_times = r
-                elif r >= 10 * 3:
-                    logger.trace(f"capps: {r / 3}")
-                elif r >= 20 * 3:
-                    logger.debug(f"capps: {r / 3}")
-                elif r >= 40 * 3:
-                    logger.info(f"capps: {r / 3}")
-        self._capture(is_next_img)
-        self.capture_cache_lock.acquire()
-        cp = self.capture_cache.copy()
-        self.capture_cache_lock.release()
-        return cp
+        if self.is_producer_running():
+            # 后台线程负责截图，这里只取最新帧
+            if is_next_img:
+                frame = self.wait_for_new()
+            else:
+                frame = self.latest()
+        else:
+            self._capture(is_next_img)
+            t = time.perf_counter()
+            self.capture_cache_lock.acquire()
+            self.stats.cache_lock_wait.record(time.perf_counter() - t)
+            frame = self.last_frame
+            self.capture_cache_lock.release()
+        self.stats.add_served()
+        self.stats.frame_age.record(frame.age())
+        if as_frame:
+            return frame
+        t = time.perf_counter()
+        ret = frame.copy()
+        self.stats.copy_time.record(time.perf_counter() - t)
+        return ret
+
+    def capture_roi(self, posi_list: list, is_next_img=False) -> list:
+        """截取一个或多个区域，耗时与区域大小成正比。
+
+        当前帧仍在1/max_fps内时直接从当前帧裁剪；否则后端支持时只截取这些区域，
+        不更新当前帧，同一截图间隔内重复截取同一区域时使用region_frame中已截取的数组。
+        区域超出上一帧范围时退回到全屏截图后裁剪。
+
+        Args:
+            posi_list (list): 区域列表，[[x1,y1,x2,y2], ...]
+            is_next_img (bool, optional): 强制截取下一张图片. Defaults to False.
+
+        Returns:
+            list[np.ndarray]: 各区域的可写数组
+        """
+        if self.will_capture_roi(posi_list, is_next_img):
+            frame = self.capture_region_frame(is_next_img)
+            return [frame.region(posi).copy() for posi in posi_list]
+        frame = self.capture(is_next_img=is_next_img, as_frame=True)
+        t = time.perf_counter()
+        ret = [crop(frame.array, posi) for posi in posi_list]
+        self.stats.copy_time.record(time.perf_counter() - t)
+        return ret
+
+    def will_capture_roi(self, posi_list: list, is_next_img=False) -> bool:
+        """capture_roi是否会只截取这些区域，而不是从当前帧裁剪或全屏截图。
+
+        Args:
+            posi_list (list): 区域列表，[[x1,y1,x2,y2], ...]
+            is_next_img (bool, optional): 强制截取下一张图片. Defaults to False.
+
+        Returns:
+            bool: 后端支持区域截图、没有后台截图线程、当前帧已超过1/max_fps且区域都在上一帧范围内时为True
+        """
+        frame = self.last_frame
+        if (not self.support_roi or frame is None or self.is_producer_running() or
+                (self.fps_timer.get_diff_time() < 1 / self.max_fps and not is_next_img)):
+            return False
+        h, w = frame.shape[:2]
+        return all(0 <= i[0] < i[2] <= w and 0 <= i[1] < i[3] <= h for i in posi_list)
+
+    def _next_frame_id(self) -> int:
+        with self._frame_seq_lock:
+            self._frame_seq += 1
+            return self._frame_seq
+
+    def _grab_roi(self, posi) -> np.ndarray:
+        return self._cover_privacy(self._get_capture_roi(posi), origin=(posi[0], posi[1]))
+
+    def capture_region_frame(self, is_next_img=False) -> RegionFrame:
+        """当前截图间隔内的区域截图帧，超过1/max_fps或is_next_img时开始新的一帧。
+        只在will_capture_roi为True时使用。
+
+        Args:
+            is_next_img (bool, optional): 强制开始新的一帧. Defaults to False.
+
+        Returns:
+            RegionFrame: 区域截图帧
+        """
+        with self.region_frame_lock:
+            frame = self.region_frame
+            if frame is None or is_next_img or frame.age() >= 1 / self.max_fps:
+                frame = self.region_frame = RegionFrame(self._next_frame_id(), self._grab_roi)
+            return frame
 
     # 捕获方法前封装
     def _capture(self, is_next_img) -> None:
         if (self.fps_timer.get_diff_time() >= 1 / self.max_fps) or is_next_img:
             self.fps_timer.reset()
-            self.capture_cache_lock.acquire()
+            self._grab_frame()
+        else:
+            pass
+
+    def _grab_frame(self) -> Frame:
+        # 截图写入新的缓冲区，完成后再交换当前帧，读取者不需要等待截图
+        t = time.perf_counter()
+        with self.grab_lock:
+            self.stats.grab_lock_wait.record(time.perf_counter() - t)
             self.capture_times += 1
-            self.capture_cache = self._cover_privacy(self._get_capture())
+            t = time.perf_counter()
             while 1:
-                self.capture_cache = self._cover_privacy(self._get_capture())
-                if not self._check_shape(self.capture_cache):
+                buf = self._get_capture_buffer()
+                img = None if buf is None else self._cover_privacy(buf.array)
+                if not self._check_shape(img):
+                    if buf is not None:
+                        buf.release()
                     logger.warning(
                         "Fail to get capture: " +
-                        f"shape: {self.capture_cache.shape}," +
+                        f"shape: {None if img is None else img.shape}," +
                         " waiting 2 sec." + '\n' +
                         "请确认原神窗口没有最小化，原神启动器关闭，原神分辨率为1080p")
                     time.sleep(2)
                 else:
                     break
+            frame = Frame(self._next_frame_id(), buffer=buf)
+            if self.rate_controller is not None:
+                # 分块校验和是自适应帧率下每次截图的开销，计入截图耗时
+                self.tile_signature(frame)
+            grab_time = time.perf_counter() - t
+            self.stats.grab_latency.record(grab_time)
+            self.stats.add_grabbed()
+            if self.rate_controller is not None:
+                self._update_rate(frame, grab_time)
+            # 旧帧没有其他使用者时，其缓冲区回到缓冲池
+            self.capture_cache_lock.acquire()
+            self.frame_id = frame.frame_id
+            self.last_frame = frame
+            self.capture_cache = frame.array
             self.capture_cache_lock.release()
-        else:
-            pass
+            self.frame_ring.push(frame)
+            if self.recorder is not None:
+                self._record(frame)
+        return frame
+
+    def _record(self, frame: Frame):
+        try:
+            self.recorder.append(frame)
+        except ValueError as e:
+            # 录制中窗口尺寸变化，丢弃这一帧并停止录制，已录制的帧正常写入文件
+            self.recorder.drop_times += 1
+            logger.warning(f"stop recording {self.recorder.path}: {e}")
+            self.stop_recording()
+
+    def start_recording(self, path: str, capacity=1000, compress=False, **kwargs) -> FrameRecorder:
+        """把之后的每一帧录制到path，可用ReplayCapture回放。录制中截图尺寸变化时丢弃该帧并停止录制。
+
+        Args:
+            path (str): 录制文件夹
+            capacity (int, optional): 最多录制的帧数. Defaults to 1000.
+            compress (bool, optional): 是否在后台压缩. Defaults to False.
+            **kwargs: 其他FrameRecorder参数
+
+        Returns:
+            FrameRecorder: 录制器
+        """
+        self.stop_recording()
+        shape = self.latest().shape
+        self.recorder = FrameRecorder(path, shape=shape, capacity=capacity, compress=compress, **kwargs)
+        return self.recorder
+
+    def stop_recording(self):
+        """停止录制并写入文件。
+        """
+        if self.recorder is not None:
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
+
+    def set_rate_controller(self, controller: CaptureRateController = None):
+        """启用自适应帧率。
+
+        Args:
+            controller (CaptureRateController, optional): 帧率控制器，为None时创建默认的控制器. Defaults to None.
+
+        Returns:
+            CaptureRateController: 帧率控制器
+        """
+        if controller is None:
+            controller = CaptureRateController()
+        self.rate_controller = controller
+        return controller
+
+    def _update_rate(self, frame: Frame, grab_time: float):
+        change_ratio = None
+        if self.last_frame is not None:
+            self.tile_signature(self.last_frame)
+            changed = self.changed_tiles(self.last_frame.frame_id, frame)
+            # 尺寸变化时整帧都视为变化
+            change_ratio = 1. if changed is None else float(changed.mean())
+        self.max_fps = self.rate_controller.update(self.frame_ring.waiting, change_ratio, grab_time)
 
+    def tile_signature(self, frame: Frame) -> np.ndarray:
+        """计算并记录frame的分块校验和。
 
+        Args:
+            frame (Frame): 截图帧
+
+        Returns:
+            np.ndarray: 分块校验和
+        """
+        sig = frame.tile_signature(self.tile_size)
+        with self.tile_history_lock:
+            if frame.frame_id not in self.tile_history:
+                self.tile_history[frame.frame_id] = sig
+                while len(self.tile_history) > self.tile_history_size:
+                    self.tile_history.popitem(last=False)
+        return sig
+
+    def changed_tiles(self, since_frame_id: int, frame: Frame = None):
+        """frame相对since_frame_id发生变化的分块。
+
+        Args:
+            since_frame_id (int): 对比的帧编号
+            frame (Frame, optional): 当前帧. Defaults to 最新帧.
+
+        Returns:
+            np.ndarray/None: bool数组，True表示该分块变化；since_frame_id的校验和已不在记录中时返回None
+        """
+        if frame is None:
+            frame = self.latest()
+        with self.tile_history_lock:
+            old = self.tile_history.get(since_frame_id)
+        if old is None:
+            return None
+        sig = self.tile_signature(frame)
+        if sig.shape != old.shape:
+            return None
+        return sig != old
+
+    def region_changed(self, posi, since_frame_id: int, frame: Frame = None) -> bool:
+        """区域posi在since_frame_id之后是否可能发生了变化，无法判断时返回True。
+
+        Args:
+            posi (list): [x1,y1,x2,y2]
+            since_frame_id (int): 对比的帧编号
+            frame (Frame, optional): 当前帧. Defaults to 最新帧.
+
+        Returns:
+            bool: bool
+        """
+        if frame is not None and frame.frame_id == since_frame_id:
+            return False
+        changed = self.changed_tiles(since_frame_id, frame)
+        if changed is None:
+            return True
+        t = self.tile_size
+        x1, y1 = max(int(posi[0]), 0) // t, max(int(posi[1]), 0) // t
+        x2, y2 = -(-int(posi[2]) // t), -(-int(posi[3]) // t)
+        return bool(changed[y1:y2, x1:x2].any())
+
+    def start_producer(self, ring_size=4):
+        """启动后台截图线程，按max_fps持续截图到环形缓冲区。
+
+        Args:
+            ring_size (int, optional): 环形缓冲区保留的帧数. Defaults to 4.
+        """
+        if self.is_producer_running():
+            return
+        if ring_size != self.frame_ring.size:
+            self.frame_ring = FrameRing(ring_size)
+        self.producer_stop_event.clear()
+        self.producer_thread = threading.Thread(target=self._producer_loop, daemon=True, name='CaptureProducer')
+        self.producer_thread.start()
+
+    def stop_producer(self):
+        """停止后台截图线程。
+        """
+        if self.producer_thread is None:
+            return
+        self.producer_stop_event.set()
+        self.producer_wake_event.set()
+        self.producer_thread.join()
+        self.producer_thread = None
+
+    def is_producer_running(self) -> bool:
+        return self.producer_thread is not None and self.producer_thread.is_alive()
+
+    def _min_frame_interval(self) -> float:
+        """后台截图的最短间隔。启用自适应帧率时为控制器的最高帧率对应的间隔，否则为1/max_fps。
+        """
+        fps = self.max_fps
+        if self.rate_controller is not None:
+            fps = max(fps, self.rate_controller.max_fps)
+        return 1 / fps
+
+    def _producer_loop(self):
+        while not self.producer_stop_event.is_set():
+            t = time.time()
+            self._grab_frame()
+            self.fps_timer.reset()
+            deadline = t + 1 / self.max_fps
+            while not self.producer_stop_event.is_set():
+                dt = deadline - time.time()
+                if dt <= 0:
+                    break
+                if self.producer_wake_event.wait(dt):
+                    self.producer_wake_event.clear()
+                    # 有使用者开始等待新帧时，只把较长的间隔缩短到最短间隔，不会超过帧率上限
+                    deadline = min(deadline, t + self._min_frame_interval())
+
+    def latest(self) -> Frame:
+        """最新的帧，不等待截图。还没有任何帧时等待或截取第一帧。
+
+        Returns:
+            Frame: 截图帧
+        """
+        frame = self.frame_ring.latest()
+        if frame is None:
+            if self.is_producer_running():
+                return self.frame_ring.wait_for_new()
+            return self.capture(as_frame=True)
+        return frame
+
+    def next_after(self, frame_id: int, timeout=None) -> Frame:
+        """编号大于frame_id的第一帧。没有后台线程时立即截取新的一帧。
+
+        Args:
+            frame_id (int): 帧编号
+            timeout (float, optional): 最长等待时间. Defaults to None.
+
+        Returns:
+            Frame: 截图帧，超时返回None
+        """
+        if not self.is_producer_running():
+            frame = self.frame_ring.next_after(frame_id, timeout=0)
+            if frame is None:
+                frame = self._grab_frame()
+            return frame
+        self.producer_wake_event.set()
+        return self.frame_ring.next_after(frame_id, timeout)
+
+    def wait_for_new(self, timeout=None) -> Frame:
+        """等待一帧新的截图，用于代替sleep后重新截图的循环。没有后台线程时立即截取。
+
+        Args:
+            timeout (float, optional): 最长等待时间. Defaults to None.
+
+        Returns:
+            Frame: 截图帧，超时返回None
+        """
+        if not self.is_producer_running():
+            return self._grab_frame()
+        self.producer_wake_event.set()
+        return self.frame_ring.wait_for_new(timeout)
+
+
+@register_capture('windows')
 class WindowsCapture(Capture):
     """
     支持Windows10, Windows11的截图。
     """
-    GetDC = ctypes.windll.user32.GetDC
-    CreateCompatibleDC = ctypes.windll.gdi32.CreateCompatibleDC
-    GetClientRect = ctypes.windll.user32.GetClientRect
-    CreateCompatibleBitmap = ctypes.windll.gdi32.CreateCompatibleBitmap
-    SelectObject = ctypes.windll.gdi32.SelectObject
-    BitBlt = ctypes.windll.gdi32.BitBlt
     SRCCOPY = 0x00CC0020
-    GetBitmapBits = ctypes.windll.gdi32.GetBitmapBits
-    DeleteObject = ctypes.windll.gdi32.DeleteObject
-    ReleaseDC = ctypes.windll.user32.ReleaseDC
-    GetDeviceCaps = win32print.GetDeviceCaps
+    support_roi = True
+    # 需要遮挡的区域 [x1,y1,x2,y2]
+    PRIVACY_AREA = [1770, 1053, 1863, 1075]
 
     def __init__(self):
         super().__init__()
+        # 在实例化时才绑定windll，使本模块在非Windows环境下也能导入
+        self.GetDC = ctypes.windll.user32.GetDC
+        self.CreateCompatibleDC = ctypes.windll.gdi32.CreateCompatibleDC
+        self.GetClientRect = ctypes.windll.user32.GetClientRect
+        self.CreateCompatibleBitmap = ctypes.windll.gdi32.CreateCompatibleBitmap
+        self.SelectObject = ctypes.windll.gdi32.SelectObject
+        self.BitBlt = ctypes.windll.gdi32.BitBlt
+        self.GetBitmapBits = ctypes.windll.gdi32.GetBitmapBits
+        self.DeleteObject = ctypes.windll.gdi32.DeleteObject
+        self.ReleaseDC = ctypes.windll.user32.ReleaseDC
+        self.GetDeviceCaps = win32print.GetDeviceCaps
+        # 跨帧复用的GDI句柄，窗口句柄变化时重建；兼容位图按尺寸缓存
+        self._dc = None
+        self._dc_handle = None
+        self._bitmaps = {}
+        self.max_bitmaps = 8
+        self.gdi_create_times = 0
         self.max_fps = 30
         self.monitor_num = 1
         self.monitor_id = 0
@@ -138,7 +555,7 @@ class WindowsCapture(Capture):
 
         return float(scale_factor.value / 100)
 
-    def _get_capture(self):
+    def _get_client_size(self):
         r = RECT()
         self.GetClientRect(static_lib.HANDLE, ctypes.byref(r))
         width, height = r.right, r.bottom
@@ -152,27 +569,181 @@ class WindowsCapture(Capture):
             logger.warning_once(f"scale: {height}")
             width = 1920
             height = 1080
+        return width, height
+
+    def _get_gdi(self, width, height):
+        if self._dc_handle != static_lib.HANDLE:
+            self.release_gdi()
+            self._dc = self.GetDC(static_lib.HANDLE)
+            self._dc_handle = static_lib.HANDLE
+        key = (width, height)
+        if key not in self._bitmaps:
+            if len(self._bitmaps) >= self.max_bitmaps:
+                cdc, bitmap = self._bitmaps.pop(next(iter(self._bitmaps)))
+                self.DeleteObject(bitmap)
+                self.DeleteObject(cdc)
+            cdc = self.CreateCompatibleDC(self._dc)
+            bitmap = self.CreateCompatibleBitmap(self._dc, width, height)
+            self.SelectObject(cdc, bitmap)
+            self._bitmaps[key] = (cdc, bitmap)
+            self.gdi_create_times += 1
+        cdc, bitmap = self._bitmaps[key]
+        return self._dc, cdc, bitmap
 
+    def release_gdi(self):
+        """释放缓存的GDI句柄。
+        """
+        for cdc, bitmap in self._bitmaps.values():
+            self.DeleteObject(bitmap)
+            self.DeleteObject(cdc)
+        if self._dc is not None:
+            self.ReleaseDC(self._dc_handle, self._dc)
+        self._bitmaps = {}
+        self._dc = None
+        self._dc_handle = None
+
+    def __del__(self):
+        if getattr(self, '_dc', None) is not None:
+            self.release_gdi()
+
+    def _get_capture_buffer(self) -> PooledBuffer:
+        width, height = self._get_client_size()
+        dc, cdc, bitmap = self._get_gdi(width, height)
         # 开始截图
-        dc = self.GetDC(static_lib.HANDLE)
-        cdc = self.CreateCompatibleDC(dc)
-        bitmap = self.CreateCompatibleBitmap(dc, width, height)
-        self.SelectObject(cdc, bitmap)
         self.BitBlt(cdc, 0, 0, width, height, dc, 0, 0, self.SRCCOPY)
-        # 截图是BGRA排列，因此总元素个数需要乘以4
+        # 截图是BGRA排列，因此总元素个数需要乘以4，直接写入缓冲区
         total_bytes = width * height * 4
-        buffer = bytearray(total_bytes)
-        byte_array = ctypes.c_ubyte * total_bytes
-        self.GetBitmapBits(bitmap, total_bytes, byte_array.from_buffer(buffer))
-        self.DeleteObject(bitmap)
-        self.DeleteObject(cdc)
-        self.ReleaseDC(static_lib.HANDLE, dc)
-        # 返回截图数据为numpy.ndarray
-        ret = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4)
+        buf = self.frame_pool.get((height, width, 4), 'uint8')
+        self.GetBitmapBits(bitmap, total_bytes, ctypes.c_void_p(buf.array.ctypes.data))
+        return buf
+
+    def _get_capture_roi(self, posi) -> np.ndarray:
+        x1, y1, x2, y2 = posi
+        width, height = x2 - x1, y2 - y1
+        dc, cdc, bitmap = self._get_gdi(width, height)
+        # 只拷贝区域内的像素
+        self.BitBlt(cdc, 0, 0, width, height, dc, x1, y1, self.SRCCOPY)
+        ret = np.empty((height, width, 4), dtype='uint8')
+        self.GetBitmapBits(bitmap, width * height * 4, ctypes.c_void_p(ret.ctypes.data))
         return ret
 
-    def _cover_privacy(self, img) -> ndarray:
-        img[1053: 1075, 1770: 1863, :3] = 128
+    def _get_capture(self):
+        buf = self._get_capture_buffer()
+        ret = buf.array.copy()
+        buf.release()
+        return ret
+
+    def _cover_privacy(self, img, origin=(0, 0)) -> ndarray:
+        x1, y1, x2, y2 = self.PRIVACY_AREA
+        x1, x2 = max(x1 - origin[0], 0), x2 - origin[0]
+        y1, y2 = max(y1 - origin[1], 0), y2 - origin[1]
+        if x2 > 0 and y2 > 0:
+            img[y1:y2, x1:x2, :3] = 128
+        return img
+
+
+@register_capture('replay')
+class ReplayCapture(Capture):
+    """
+    回放截图。按顺序播放图片文件夹或视频文件中的帧，不依赖任何窗口，
+    用于在Linux测试机上以远超实时的速度跑通 截图->识别 流程。
+    """
+    IMG_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, source: str, fps=None, loop=True):
+        """
+        Args:
+            source (str): 图片文件夹、FrameRecorder录制的文件夹、单张图片或视频文件路径。文件夹内图片按文件名排序。
+            fps (float, optional): 回放帧率，按真实时间推进帧。None时每次截图前进一帧，尽可能快. Defaults to None.
+            loop (bool, optional): 播放完毕后是否从头循环，否则停在最后一帧. Defaults to True.
+        """
+        super().__init__()
+        self.source = source
+        self.fps = fps
+        self.loop = loop
+        self.finished = False
+        # fps为None时不限制截图速度
+        self.max_fps = fps if fps is not None else float('inf')
+        self.frame_index = -1
+        self.start_time = None
+        self._frames = []
+        self._video = None
+        self._video_index = -1
+        self._video_frame = None
+        if os.path.isdir(source) and FrameReader.is_record(source):
+            self._frames = FrameReader(source)
+        elif os.path.isdir(source):
+            names = sorted(i for i in os.listdir(source) if i.lower().endswith(self.IMG_EXTS))
+            self._frames = [self._to_bgra(cv2.imread(os.path.join(source, i), cv2.IMREAD_UNCHANGED)) for i in names]
+        elif source.lower().endswith(self.IMG_EXTS):
+            self._frames = [self._to_bgra(cv2.imread(source, cv2.IMREAD_UNCHANGED))]
+        else:
+            self._video = cv2.VideoCapture(source)
+            if not self._video.isOpened():
+                raise FileNotFoundError(source)
+        if self._video is None and len(self._frames) == 0:
+            raise FileNotFoundError(source)
+
+    @staticmethod
+    def _to_bgra(img: ndarray) -> ndarray:
+        # 与WindowsCapture保持一致，统一输出BGRA
+        if img is None:
+            return None
+        if len(img.shape) == 2:
+            return cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+        if img.shape[2] == 3:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+        return img
+
+    def __len__(self):
+        if self._video is not None:
+            return int(self._video.get(cv2.CAP_PROP_FRAME_COUNT))
+        return len(self._frames)
+
+    def _next_index(self) -> int:
+        if self.fps is None:
+            return self.frame_index + 1
+        if self.start_time is None:
+            self.start_time = time.time()
+        return int((time.time() - self.start_time) * self.fps)
+
+    def _read_video(self, index: int):
+        if index < self._video_index:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._video_index = -1
+        # 实时回放时跳过来不及播放的帧
+        while self._video_index < index - 1:
+            if not self._video.grab():
+                return None
+            self._video_index += 1
+        succ, img = self._video.read()
+        if not succ:
+            return None
+        self._video_index += 1
+        self._video_frame = self._to_bgra(img)
+        return self._video_frame
+
+    def _get_capture(self) -> np.ndarray:
+        index = self._next_index()
+        if self._video is not None:
+            img = self._read_video(index)
+            if img is None:
+                if self.loop and self._video_index >= 0:
+                    self.start_time = time.time()
+                    img = self._read_video(0)
+                    index = 0
+                else:
+                    self.finished = True
+                    return self._video_frame
+        else:
+            if index >= len(self._frames):
+                if self.loop:
+                    index = index % len(self._frames)
+                else:
+                    self.finished = True
+                    index = len(self._frames) - 1
+            img = self._frames[index]
+        self.frame_index = index
         return img
 
 
@@ -0,0 +1,103 @@
+import threading
+
+
+class CaptureRateController():
+    """
+    按需调整截图帧率。
+    有使用者在等待新帧或画面在变化时提高帧率，画面静止且无人等待时逐渐降到min_fps；
+    帧率上限受截图耗时限制，截图最多占用grab_share比例的时间。
+    """
+
+    def __init__(self, min_fps=3, max_fps=60, step_up=2.0, step_down=0.8, change_threshold=0.002,
+                 grab_share=0.5, smooth=0.2):
+        """
+        Args:
+            min_fps (float, optional): 最低帧率. Defaults to 3.
+            max_fps (float, optional): 最高帧率. Defaults to 60.
+            step_up (float, optional): 每次提升的倍数. Defaults to 2.0.
+            step_down (float, optional): 每次下降的倍数. Defaults to 0.8.
+            change_threshold (float, optional): 变化分块比例超过该值时认为画面在变化. Defaults to 0.002.
+            grab_share (float, optional): 截图耗时最多占用的时间比例. Defaults to 0.5.
+            smooth (float, optional): 截图耗时与变化比例的指数平滑系数. Defaults to 0.2.
+        """
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.step_up = step_up
+        self.step_down = step_down
+        self.change_threshold = change_threshold
+        self.grab_share = grab_share
+        self.smooth = smooth
+        self.lock = threading.Lock()
+
+        self.fps = min_fps
+        self.waiting = 0
+        self.change_ratio = 0.
+        self.grab_time = 0.
+        self.reasons = []
+        self.update_times = 0
+
+    def _smooth(self, old, new):
+        if self.update_times == 0:
+            return new
+        return old + (new - old) * self.smooth
+
+    def update(self, waiting: int, change_ratio, grab_time: float) -> float:
+        """根据最新一帧的情况计算下一帧的帧率。
+
+        Args:
+            waiting (int): 正在等待新帧的使用者数量
+            change_ratio (float/None): 与上一帧相比变化的分块比例，无法判断时为None
+            grab_time (float): 本次截图耗时，单位为秒
+
+        Returns:
+            float: 新的帧率
+        """
+        with self.lock:
+            self.grab_time = self._smooth(self.grab_time, grab_time)
+            if change_ratio is not None:
+                # 变化时立即响应，静止时缓慢回落
+                self.change_ratio = max(change_ratio, self._smooth(self.change_ratio, change_ratio))
+            self.waiting = waiting
+            self.update_times += 1
+
+            fps = self.fps
+            reasons = []
+            if waiting > 0:
+                fps *= self.step_up
+                reasons.append(f'waiting consumers: {waiting}')
+            if self.change_ratio > self.change_threshold:
+                fps *= self.step_up
+                reasons.append(f'scene changing: {round(self.change_ratio, 4)}')
+            if waiting == 0 and self.change_ratio <= self.change_threshold:
+                fps *= self.step_down
+                reasons.append('static scene')
+            if self.grab_time > 0:
+                grab_limit = self.grab_share / self.grab_time
+                if fps > grab_limit:
+                    fps = grab_limit
+                    reasons.append(f'grab time limit: {round(self.grab_time * 1000, 2)} ms')
+            if fps > self.max_fps:
+                fps = self.max_fps
+                reasons.append('max fps')
+            if fps < self.min_fps:
+                fps = self.min_fps
+                reasons.append('min fps')
+            self.fps = fps
+            self.reasons = reasons
+            return fps
+
+    def metrics(self) -> dict:
+        """当前帧率及其原因。
+
+        Returns:
+            dict: fps, reasons, waiting, change_ratio, grab_time
+        """
+        with self.lock:
+            return {
+                'fps': self.fps,
+                'reasons': list(self.reasons),
+                'waiting': self.waiting,
+                'change_ratio': self.change_ratio,
+                'grab_time': self.grab_time,
+                'update_times': self.update_times,
+            }
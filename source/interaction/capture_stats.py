@@ -0,0 +1,54 @@
+import threading
+import time
+
+from source.common.timer_module import Histogram
+
+
+class CaptureStats():
+    """
+    截图统计。常开，记录截图耗时、锁等待、拷贝耗时、帧被使用时的年龄，
+    以及截取与提供给使用者的帧数。单位均为秒。
+    锁等待分为截图时等待grab_lock(grab_lock_wait)和读取当前帧时等待capture_cache_lock(cache_lock_wait)。
+    """
+    HISTOGRAMS = ('grab_latency', 'grab_lock_wait', 'cache_lock_wait', 'copy_time', 'frame_age')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.grab_latency = Histogram()
+        self.grab_lock_wait = Histogram()
+        self.cache_lock_wait = Histogram()
+        self.copy_time = Histogram()
+        self.frame_age = Histogram()
+        self.frames_grabbed = 0
+        self.frames_served = 0
+        self.start_time = time.time()
+
+    def add_grabbed(self):
+        with self.lock:
+            self.frames_grabbed += 1
+
+    def add_served(self, n=1):
+        with self.lock:
+            self.frames_served += n
+
+    def reset(self):
+        for name in self.HISTOGRAMS:
+            getattr(self, name).reset()
+        with self.lock:
+            self.frames_grabbed = 0
+            self.frames_served = 0
+            self.start_time = time.time()
+
+    def snapshot(self) -> dict:
+        """导出当前统计。
+
+        Returns:
+            dict: 各直方图的snapshot，以及frames_grabbed, frames_served, serve_per_grab, duration
+        """
+        ret = {name: getattr(self, name).snapshot() for name in self.HISTOGRAMS}
+        with self.lock:
+            ret['frames_grabbed'] = self.frames_grabbed
+            ret['frames_served'] = self.frames_served
+            ret['serve_per_grab'] = self.frames_served / self.frames_grabbed if self.frames_grabbed else None
+            ret['duration'] = time.time() - self.start_time
+        return ret
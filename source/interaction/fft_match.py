@@ -0,0 +1,372 @@
+import collections
+import math
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+
+class FFTMatcher():
+    """
+    基于FFT的TM_CCORR_NORMED模板匹配，结果与cv2.matchTemplate一致:
+    无掩码时相差不超过MAX_ERROR(float32计算，实测约1e-5)，掩码匹配在暗处窗口相差不超过MAX_MASK_ERROR。
+    搜索区域的频谱与平方和积分图在共用该区域的多个模板间复用，
+    cv2.matchTemplate(spatial)也使用同一份积分图归一化。
+    支持与cv2.matchTemplate相同语义的二值掩码。
+    choose按代价模型在cv2.matchTemplate(spatial)与FFT之间选择。
+
+    只缓存内容不会改变的数据:
+    模板(与掩码)只在是只读且自有内存的数组时(如CompiledTemplate中的数组)按id缓存，并用弱引用确认仍是同一个数组；
+    搜索区域只在调用者给出img_key时缓存，img_key须唯一对应图像内容，例如(帧编号, 区域, 转换)。
+    没有img_key的搜索区域每次重新计算，原地复用的缓冲区不会得到上一帧的结果。
+    """
+    # 代价模型系数，单位为ms/百万像素，按1920x1080单核测得，可按机器调整
+    SPATIAL_GRAY = 15.
+    SPATIAL_COLOR = 140.
+    SPATIAL_TEMPLATE_AREA = 40000
+    DFT = 13.
+    IDFT = 10.
+    MUL = 3.
+    NORM = 8.
+    SPATIAL_MASK_GRAY = 3.
+    # 与cv2.matchTemplate结果的最大差值，见source/test/test_match_norm.py
+    MAX_ERROR = 1e-4
+    MAX_MASK_ERROR = 5e-3
+
+    def __init__(self, max_templates=256, max_images=8):
+        """
+        Args:
+            max_templates (int, optional): 缓存的模板频谱数量上限. Defaults to 256.
+            max_images (int, optional): 缓存的搜索区域频谱数量上限. Defaults to 8.
+        """
+        self.max_templates = max_templates
+        self.max_images = max_images
+        self.lock = threading.Lock()
+        self._templates = collections.OrderedDict()
+        self._images = collections.OrderedDict()
+        self.template_hits = 0
+        self.template_misses = 0
+        self.image_hits = 0
+        self.image_misses = 0
+        self.fft_times = 0
+        self.spatial_times = 0
+
+    @staticmethod
+    def dft_size(img_shape):
+        return cv2.getOptimalDFTSize(img_shape[0]), cv2.getOptimalDFTSize(img_shape[1])
+
+    @staticmethod
+    def _channels(img):
+        return 1 if len(img.shape) == 2 else img.shape[2]
+
+    def _lookup(self, cache, key, arr):
+        with self.lock:
+            item = cache.get(key)
+            if item is None:
+                return None
+            if item[0]() is not arr:
+                del cache[key]
+                return None
+            cache.move_to_end(key)
+            return item
+
+    def _store(self, cache, key, item, max_size):
+        with self.lock:
+            cache[key] = item
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+
+    def _spectra(self, img, size, dtype='float32'):
+        """img各通道补零到size后的频谱"""
+        ny, nx = size
+        h, w = img.shape[:2]
+        ret = []
+        for channel in (cv2.split(img) if len(img.shape) == 3 else [img]):
+            padded = cv2.copyMakeBorder(channel.astype(dtype), 0, ny - h, 0, nx - w, cv2.BORDER_CONSTANT)
+            ret.append(cv2.dft(padded))
+        return ret
+
+    @staticmethod
+    def cacheable(arr) -> bool:
+        """只读且自有内存的数组内容不会再改变，可以按id缓存。
+        """
+        return not arr.flags.writeable and arr.flags.owndata
+
+    def _template_entry(self, template, size, norm=None):
+        key = (id(template), size)
+        cacheable = self.cacheable(template)
+        if cacheable:
+            item = self._lookup(self._templates, key, template)
+            if item is not None:
+                self.template_hits += 1
+                return item
+        self.template_misses += 1
+        if norm is None:
+            norm = float(np.square(template, dtype='float64').sum())
+        item = (weakref.ref(template), self._spectra(template, size), norm)
+        if cacheable:
+            self._store(self._templates, key, item, self.max_templates)
+        return item
+
+    def _mask_entry(self, mask, size):
+        key = (id(mask), size)
+        cacheable = self.cacheable(mask)
+        if cacheable:
+            item = self._lookup(self._templates, key, mask)
+            if item is not None:
+                return item
+        binary = (mask > 0).astype('uint8')
+        item = (weakref.ref(mask), self._spectra(binary, size, 'float64'), None)
+        if cacheable:
+            self._store(self._templates, key, item, self.max_templates)
+        return item
+
+    def _image_entry(self, img, img_key=None):
+        """搜索区域的缓存项，(图像形状与类型, 派生数据dict)。
+        派生数据按需计算: 各尺寸的频谱、平方和图及其积分图、各模板大小的窗口能量。
+        img_key为None时返回不缓存的新项。"""
+        if img_key is None:
+            self.image_misses += 1
+            return (img.shape, img.dtype), {}
+        with self.lock:
+            item = self._images.get(img_key)
+            if item is not None and item[0] == (img.shape, img.dtype):
+                self._images.move_to_end(img_key)
+                self.image_hits += 1
+                return item
+        self.image_misses += 1
+        item = ((img.shape, img.dtype), {})
+        self._store(self._images, img_key, item, self.max_images)
+        return item
+
+    def _image_spectra(self, entry, img, size):
+        data = entry[1]
+        spectra = data.get(('spectra', size))
+        if spectra is None:
+            spectra = data[('spectra', size)] = self._spectra(img, size)
+        return spectra
+
+    def _sq(self, entry, img):
+        """各通道平方和图，float32"""
+        data = entry[1]
+        sq = data.get('sq')
+        if sq is None:
+            f = img.astype('float32')
+            sq = cv2.multiply(f, f)
+            if len(img.shape) == 3:
+                # 各通道平方和，窗口能量只需对单通道计算
+                sq = cv2.transform(sq, np.ones((1, img.shape[2]), dtype='float32'))
+            data['sq'] = sq
+        return sq
+
+    def _sq_spectrum(self, entry, img, size):
+        """搜索区域各通道平方和的频谱，掩码匹配时计算窗口能量用。
+        平方和的动态范围大，float32会使暗处窗口的能量误差过大，使用float64"""
+        data = entry[1]
+        spectrum = data.get(('sq_spectrum', size))
+        if spectrum is None:
+            spectrum = data[('sq_spectrum', size)] = self._spectra(self._sq(entry, img), size, 'float64')[0]
+        return spectrum
+
+    def window_norm(self, img, th, tw, img_key=None) -> np.ndarray:
+        """每个匹配位置对应窗口的sqrt(sum(I^2))，即TM_CCORR_NORMED中图像部分的归一化系数。
+        同一搜索区域只计算一次平方和的积分图，各模板大小的结果由积分图四角相减得到并缓存，
+        共用同一区域的所有模板都不再重复计算。
+
+        Args:
+            img (numpy.ndarray): 搜索区域
+            th (int): 模板高度
+            tw (int): 模板宽度
+            img_key (hashable, optional): 图像内容的唯一标识，为None时不缓存. Defaults to None.
+
+        Returns:
+            numpy.ndarray: float32，形状与cv2.matchTemplate的结果相同
+        """
+        return self._window_entry(self._image_entry(img, img_key), img, th, tw)[0]
+
+    def _window_entry(self, entry, img, th, tw):
+        """(window_norm, 1/window_norm)，窗口能量为0处倒数为0"""
+        data = entry[1]
+        item = data.get(('window', th, tw))
+        if item is None:
+            integral = data.get('integral')
+            if integral is None:
+                # 平方和是整数，float64积分图相减没有舍入误差
+                integral = data['integral'] = cv2.integral(self._sq(entry, img), sdepth=cv2.CV_64F)
+            h, w = img.shape[:2]
+            oh, ow = h - th + 1, w - tw + 1
+            window = cv2.subtract(integral[th:th + oh, tw:tw + ow], integral[:oh, tw:tw + ow])
+            window = cv2.subtract(window, integral[th:th + oh, :ow])
+            window = cv2.sqrt(cv2.add(window, integral[:oh, :ow]).astype('float32'))
+            inv = np.zeros(window.shape, dtype='float32')
+            np.divide(1, window, out=inv, where=window > 0)
+            item = data[('window', th, tw)] = (window, inv)
+        return item
+
+    def _normalize(self, corr, inv_window, tpl_norm) -> np.ndarray:
+        """corr / (window_norm * sqrt(tpl_norm))，用窗口能量的倒数只需一次乘法"""
+        if tpl_norm <= 0:
+            return np.zeros(corr.shape, dtype='float32')
+        res = cv2.multiply(corr, inv_window, scale=1 / math.sqrt(tpl_norm))
+        np.clip(res, -1, 1, out=res)
+        return res
+
+    def is_cached(self, img, template, img_key=None) -> tuple:
+        """
+        Returns:
+            (bool, bool): 搜索区域频谱和模板频谱是否已缓存
+        """
+        size = self.dft_size(img.shape)
+        with self.lock:
+            img_item = self._images.get(img_key) if img_key is not None else None
+            tpl_item = self._templates.get((id(template), size))
+            return (img_item is not None and img_item[0] == (img.shape, img.dtype) and ('spectra', size) in img_item[1],
+                    tpl_item is not None and tpl_item[0]() is template)
+
+    def cost(self, img_shape, template_shape, img_cached=False, template_cached=False, masked=False) -> tuple:
+        """估计两种方法的耗时。
+
+        Returns:
+            (float, float): spatial与FFT的估计耗时，单位为ms
+        """
+        h, w = img_shape[:2]
+        th, tw = template_shape[:2]
+        c = 1 if len(img_shape) == 2 else img_shape[2]
+        out = (h - th + 1) * (w - tw + 1) / 1e6
+        spatial = out * (self.SPATIAL_GRAY if c == 1 else self.SPATIAL_COLOR) * (1 + th * tw / self.SPATIAL_TEMPLATE_AREA)
+        ny, nx = self.dft_size(img_shape)
+        n = ny * nx / 1e6 * math.log2(ny * nx) / math.log2(1080 * 1920)
+        transforms = (0 if img_cached else c) + (0 if template_cached else c)
+        fft = n * (self.DFT * transforms + self.IDFT + self.MUL * c) + out * self.NORM
+        if masked:
+            # cv2单通道掩码匹配约慢3倍；FFT多一次float64的平方和相关，约为float32的3倍
+            if c == 1:
+                spatial *= self.SPATIAL_MASK_GRAY
+            fft += n * 3 * (self.IDFT + self.MUL + (0 if img_cached else self.DFT))
+        return spatial, fft
+
+    def choose(self, img, template, mask=None, img_key=None) -> str:
+        """
+        Returns:
+            str: 'fft'或'spatial'
+        """
+        spatial, fft = self.cost(img.shape, template.shape, *self.is_cached(img, template, img_key),
+                                 masked=mask is not None)
+        return 'fft' if fft < spatial else 'spatial'
+
+    def match(self, img, template, template_norm=None, mask=None, img_key=None) -> np.ndarray:
+        """FFT计算TM_CCORR_NORMED。
+
+        Args:
+            img (numpy.ndarray): 搜索区域，uint8，1或多通道
+            template (numpy.ndarray): 模板，通道数与img相同
+            template_norm (float, optional): 预先计算的sum(T^2)，为None时计算. Defaults to None.
+            mask (numpy.ndarray, optional): 单通道二值掩码，大小与模板相同。模板中掩码外的像素需为0. Defaults to None.
+            img_key (hashable, optional): 图像内容的唯一标识，给出时缓存搜索区域的频谱与窗口能量. Defaults to None.
+
+        Returns:
+            numpy.ndarray: 与cv2.matchTemplate形状相同的float32结果
+        """
+        h, w = img.shape[:2]
+        th, tw = template.shape[:2]
+        if th > h or tw > w or self._channels(img) != self._channels(template):
+            raise ValueError(f"template {template.shape} does not fit image {img.shape}")
+        size = self.dft_size(img.shape)
+        _, tpl_spectra, tpl_norm = self._template_entry(template, size, template_norm)
+        entry = self._image_entry(img, img_key)
+        img_spectra = self._image_spectra(entry, img, size)
+
+        acc = None
+        for fi, ft in zip(img_spectra, tpl_spectra):
+            m = cv2.mulSpectrums(fi, ft, 0, conjB=True)
+            acc = m if acc is None else cv2.add(acc, m)
+        # 循环相关在[0, h-th]x[0, w-tw]范围内没有回绕，等于线性相关
+        corr = cv2.idft(acc, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:h - th + 1, :w - tw + 1]
+
+        if mask is not None:
+            # 掩码内的窗口能量sum(I^2*M)，由平方和图与掩码相关得到
+            _, mask_spectra, _ = self._mask_entry(mask, size)
+            m = cv2.mulSpectrums(self._sq_spectrum(entry, img, size), mask_spectra[0], 0, conjB=True)
+            window = cv2.idft(m, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:h - th + 1, :w - tw + 1]
+            # 整数图像的窗口能量是整数，取整去掉全黑窗口中的残差
+            window = np.sqrt(np.maximum(np.rint(window), 0)).astype('float32')
+            inv = np.zeros(window.shape, dtype='float32')
+            np.divide(1, window, out=inv, where=window > 0)
+        else:
+            inv = self._window_entry(entry, img, th, tw)[1]
+        self.fft_times += 1
+        return self._normalize(corr, inv, tpl_norm)
+
+    def spatial(self, img, template, template_norm=None, img_key=None) -> np.ndarray:
+        """cv2.matchTemplate(TM_CCORR)计算未归一化的相关，再用共用的window_norm归一化。
+        结果与TM_CCORR_NORMED一致，省去cv2每次调用时对搜索区域重新计算的积分图。
+
+        Args:
+            img (numpy.ndarray): 搜索区域
+            template (numpy.ndarray): 模板，通道数与img相同
+            template_norm (float, optional): 预先计算的sum(T^2)，为None时计算. Defaults to None.
+            img_key (hashable, optional): 同match. Defaults to None.
+
+        Returns:
+            numpy.ndarray: 与cv2.matchTemplate形状相同的float32结果
+        """
+        th, tw = template.shape[:2]
+        self.spatial_times += 1
+        if img_key is None:
+            # 不能缓存时共用的积分图没有意义
+            return cv2.matchTemplate(img, template, cv2.TM_CCORR_NORMED)
+        entry = self._image_entry(img, img_key)
+        if self._channels(img) == 1:
+            # 单通道时cv2的归一化较便宜，同一大小的模板第二次匹配该区域时才计算共用的窗口能量
+            data = entry[1]
+            sizes = data.setdefault('spatial_sizes', set())
+            if ('window', th, tw) not in data and (th, tw) not in sizes:
+                sizes.add((th, tw))
+                return cv2.matchTemplate(img, template, cv2.TM_CCORR_NORMED)
+        if template_norm is None:
+            template_norm = float(np.square(template, dtype='float64').sum())
+        corr = cv2.matchTemplate(img, template, cv2.TM_CCORR)
+        return self._normalize(corr, self._window_entry(entry, img, th, tw)[1], template_norm)
+
+    def match_template(self, img, template, method='auto', template_norm=None, mask=None, img_key=None) -> np.ndarray:
+        """按method计算TM_CCORR_NORMED。
+
+        Args:
+            method (str, optional): 'auto'按代价模型选择, 'fft'或'spatial'. Defaults to 'auto'.
+            template_norm (float, optional): 预先计算的sum(T^2)，FFT时使用. Defaults to None.
+            mask (numpy.ndarray, optional): 同match. Defaults to None.
+            img_key (hashable, optional): 同match. Defaults to None.
+        """
+        if method == 'auto':
+            method = self.choose(img, template, mask, img_key)
+        if method == 'fft':
+            return self.match(img, template, template_norm, mask, img_key)
+        if mask is None:
+            return self.spatial(img, template, template_norm, img_key)
+        self.spatial_times += 1
+        res = cv2.matchTemplate(img, template, cv2.TM_CCORR_NORMED, mask=mask)
+        if mask is not None:
+            # 掩码内全黑的窗口为0/0
+            np.nan_to_num(res, copy=False, nan=0, posinf=0, neginf=0)
+        return res
+
+    def clear(self):
+        with self.lock:
+            self._templates.clear()
+            self._images.clear()
+
+    def counters(self) -> dict:
+        """
+        Returns:
+            dict: template_hits, template_misses, image_hits, image_misses, fft_times, spatial_times
+        """
+        return {
+            'template_hits': self.template_hits,
+            'template_misses': self.template_misses,
+            'image_hits': self.image_hits,
+            'image_misses': self.image_misses,
+            'fft_times': self.fft_times,
+            'spatial_times': self.spatial_times,
+        }
@@ -0,0 +1,269 @@
+import collections
+import threading
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from source.interaction.frame_pool import PooledBuffer
+
+
+def tile_signature(img: np.ndarray, tile_size=40) -> np.ndarray:
+    """计算每个tile_size*tile_size小块的crc32，用于判断帧间哪些区域发生了变化。
+    与求和不同，块内像素移动位置也会改变结果。
+
+    Args:
+        img (np.ndarray): 图片数组
+        tile_size (int, optional): 小块边长. Defaults to 40.
+
+    Returns:
+        np.ndarray: uint32, shape为(ceil(h/tile_size), ceil(w/tile_size))
+    """
+    h, w = img.shape[:2]
+    v = np.ascontiguousarray(img).reshape(h, w, -1)
+    c = v.shape[2] * v.itemsize
+    v = v.view(np.uint8).reshape(h, w, c)
+    t = tile_size
+    nw = w // t
+    sig = np.empty((-(-h // t), -(-w // t)), dtype=np.uint32)
+    for i in range(sig.shape[0]):
+        band = v[i * t:(i + 1) * t]
+        # 把一行小块排成连续内存，每块的数据连续后逐块计算crc32
+        tiles = np.ascontiguousarray(band[:, :nw * t].reshape(band.shape[0], nw, t * c).transpose(1, 0, 2))
+        for j in range(nw):
+            sig[i, j] = zlib.crc32(tiles[j])
+        if nw < sig.shape[1]:
+            sig[i, nw] = zlib.crc32(np.ascontiguousarray(band[:, nw * t:]))
+    return sig
+
+
+class Frame():
+    """
+    只读的截图帧。多个使用者可以共享同一个Frame而无需拷贝。
+    Frame持有其缓冲区的引用，使用array期间需要保持Frame对象存活；
+    需要可写数组时使用copy()。
+    """
+
+    def __init__(self, frame_id: int, array: np.ndarray = None, buffer: PooledBuffer = None, timestamp=None):
+        """
+        Args:
+            frame_id (int): 单调递增的帧编号
+            array (np.ndarray, optional): 图片数组，buffer为None时使用. Defaults to None.
+            buffer (PooledBuffer, optional): 缓冲池中的缓冲区，Frame接管它的一次引用. Defaults to None.
+            timestamp (float, optional): 截图时间. Defaults to time.time().
+        """
+        self.frame_id = frame_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._buffer = buffer
+        if buffer is not None:
+            array = buffer.array
+        self.array = array.view()
+        self.array.flags.writeable = False
+        self._tile_signatures = {}
+        # 图像金字塔缓存 (level, gray) -> ndarray
+        self._pyramid = {}
+        self._pyramid_lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def copy(self) -> np.ndarray:
+        """获得可写的拷贝。
+
+        Returns:
+            np.ndarray: 图片数组
+        """
+        return self.array.copy()
+
+    def tile_signature(self, tile_size=40) -> np.ndarray:
+        """本帧的分块校验和，首次调用时计算并缓存。
+        """
+        if tile_size not in self._tile_signatures:
+            self._tile_signatures[tile_size] = tile_signature(self.array, tile_size)
+        return self._tile_signatures[tile_size]
+
+    def pyramid(self, level: int, gray=False) -> np.ndarray:
+        """图像金字塔的第level层，首次请求时计算并缓存，同一帧只计算一次。
+
+        Args:
+            level (int): 0为原图，1为1/2，2为1/4，3为1/8
+            gray (bool, optional): 是否为灰度图. Defaults to False.
+
+        Returns:
+            np.ndarray: 只读数组
+        """
+        key = (level, gray)
+        img = self._pyramid.get(key)
+        if img is not None:
+            return img
+        # 逐层由上一层缩小，上一层也会被缓存
+        if level == 0:
+            if not gray:
+                return self.array
+            src = self.array
+        else:
+            src = self.pyramid(level - 1, gray)
+        with self._pyramid_lock:
+            img = self._pyramid.get(key)
+            if img is not None:
+                return img
+            if level == 0:
+                img = cv2.cvtColor(src, cv2.COLOR_BGRA2GRAY if src.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+            else:
+                h, w = src.shape[:2]
+                img = cv2.resize(src, (max(w // 2, 1), max(h // 2, 1)), interpolation=cv2.INTER_AREA)
+            img.flags.writeable = False
+            self._pyramid[key] = img
+        return img
+
+    def clear_cache(self):
+        """丢弃本帧的派生数据(金字塔等)。帧离开环形缓冲区时调用。
+        """
+        with self._pyramid_lock:
+            self._pyramid = {}
+
+    def age(self) -> float:
+        """距截图的时间，单位为秒。
+        """
+        return time.time() - self.timestamp
+
+    def release(self):
+        """提前释放缓冲区，之后不能再使用array。
+        """
+        if self._buffer is not None:
+            buffer = self._buffer
+            self._buffer = None
+            buffer.release()
+
+    def __del__(self):
+        self.release()
+
+    def __repr__(self):
+        return f'Frame(id={self.frame_id}, shape={self.shape}, timestamp={round(self.timestamp, 3)})'
+
+
+class RegionFrame():
+    """
+    后端只截取部分区域时的一次截图。与Frame共用帧编号序列，在一个截图间隔(1/max_fps)内有效:
+    同一间隔内截取的各区域共用一个frame_id，重复请求同一区域时直接返回已截取的只读数组，
+    因此按帧编号缓存的匹配结果、派生图像与跟踪状态对区域截图同样适用。
+    """
+
+    def __init__(self, frame_id: int, grab, timestamp=None):
+        """
+        Args:
+            frame_id (int): 帧编号
+            grab (callable): 参数为区域[x1,y1,x2,y2]，返回该区域的截图
+            timestamp (float, optional): 截图时间. Defaults to time.time().
+        """
+        self.frame_id = frame_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._grab = grab
+        self._regions = {}
+        self._lock = threading.Lock()
+        self.grab_times = 0
+
+    def region(self, posi) -> np.ndarray:
+        """区域posi的截图，本帧中首次请求时截取。
+
+        Args:
+            posi (list): [x1,y1,x2,y2]
+
+        Returns:
+            np.ndarray: 只读数组
+        """
+        key = tuple(int(round(i)) for i in posi)
+        with self._lock:
+            img = self._regions.get(key)
+            if img is None:
+                img = np.ascontiguousarray(self._grab(list(key)))
+                img.flags.writeable = False
+                self._regions[key] = img
+                self.grab_times += 1
+            return img
+
+    def age(self) -> float:
+        """距本帧开始的时间，单位为秒。
+        """
+        return time.time() - self.timestamp
+
+    def __repr__(self):
+        return f'RegionFrame(id={self.frame_id}, regions={len(self._regions)}, timestamp={round(self.timestamp, 3)})'
+
+
+class FrameRing():
+    """
+    线程安全的帧环形缓冲区。截图线程push新帧，使用者取最新帧或等待新帧。
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self.frames = collections.deque(maxlen=size)
+        self.cond = threading.Condition()
+        # 正在等待新帧的使用者数量
+        self.waiting = 0
+
+    def push(self, frame: Frame):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.frames[0].clear_cache()
+            self.frames.append(frame)
+            self.cond.notify_all()
+
+    def latest(self) -> Frame:
+        """最新的帧，没有时返回None。
+        """
+        with self.cond:
+            return self.frames[-1] if self.frames else None
+
+    def get(self, frame_id: int) -> Frame:
+        """按帧编号获取仍在缓冲区中的帧，不存在时返回None。
+        """
+        with self.cond:
+            for frame in self.frames:
+                if frame.frame_id == frame_id:
+                    return frame
+        return None
+
+    def _first_after(self, frame_id):
+        for frame in self.frames:
+            if frame.frame_id > frame_id:
+                return frame
+        return None
+
+    def next_after(self, frame_id: int, timeout=None) -> Frame:
+        """编号大于frame_id的第一帧，没有时等待。
+
+        Args:
+            frame_id (int): 帧编号
+            timeout (float, optional): 最长等待时间，None为一直等待. Defaults to None.
+
+        Returns:
+            Frame: 帧，超时返回None
+        """
+        with self.cond:
+            self.waiting += 1
+            try:
+                self.cond.wait_for(lambda: self._first_after(frame_id) is not None, timeout)
+                return self._first_after(frame_id)
+            finally:
+                self.waiting -= 1
+
+    def wait_for_new(self, timeout=None) -> Frame:
+        """等待比当前最新帧更新的一帧。
+
+        Args:
+            timeout (float, optional): 最长等待时间. Defaults to None.
+
+        Returns:
+            Frame: 帧，超时返回None
+        """
+        with self.cond:
+            frame_id = self.frames[-1].frame_id if self.frames else 0
+        return self.next_after(frame_id, timeout)
+
+    def clear(self):
+        with self.cond:
+            self.frames.clear()
@@ -0,0 +1,81 @@
+import collections
+import threading
+
+import numpy as np
+
+
+class FrameViewCache():
+    """
+    帧派生图像缓存，键为(frame_id, 区域, 转换)。
+    同一帧同一区域的灰度图、jpgmode转换结果只计算一次，按内存上限LRU淘汰。
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int, optional): 缓存占用内存上限. Defaults to 128MB.
+        """
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(frame_id, posi, transform):
+        if posi is not None:
+            posi = tuple(int(i) for i in posi)
+        return frame_id, posi, transform
+
+    def get(self, frame_id: int, posi, transform, compute) -> np.ndarray:
+        """取出缓存的派生图像，不存在时调用compute计算并缓存。
+
+        Args:
+            frame_id (int): 帧编号
+            posi (list/None): 区域[x1,y1,x2,y2]，None为整帧
+            transform (hashable): 转换的标识
+            compute (callable): 无参数函数，返回派生图像
+
+        Returns:
+            np.ndarray: 只读数组，多个使用者共享
+        """
+        key = self._key(frame_id, posi, transform)
+        with self.lock:
+            img = self._cache.get(key)
+            if img is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+        img = compute()
+        img.flags.writeable = False
+        with self.lock:
+            if key not in self._cache:
+                self._cache[key] = img
+                self.nbytes += img.nbytes
+                while self.nbytes > self.max_bytes and len(self._cache) > 1:
+                    _, old = self._cache.popitem(last=False)
+                    self.nbytes -= old.nbytes
+                    self.evictions += 1
+        return img
+
+    def clear(self):
+        with self.lock:
+            self._cache.clear()
+            self.nbytes = 0
+
+    def counters(self) -> dict:
+        """
+        Returns:
+            dict: hits, misses, evictions, nbytes, entries
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'nbytes': self.nbytes,
+                'entries': len(self._cache),
+            }
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+
+
+class PooledBuffer():
+    """
+    缓冲池中的一块预分配内存，使用引用计数管理。
+    引用计数归零时自动回到缓冲池，供下一帧复用。
+    """
+
+    def __init__(self, pool, shape, dtype):
+        self.pool = pool
+        self.array = np.empty(shape, dtype=dtype)
+        self.ref_count = 0
+
+    @property
+    def key(self):
+        return self.array.shape, self.array.dtype.str
+
+    def acquire(self):
+        """增加一次引用。
+
+        Returns:
+            PooledBuffer: self
+        """
+        with self.pool.lock:
+            self.ref_count += 1
+        return self
+
+    def release(self):
+        """释放一次引用。
+        """
+        self.pool._release(self)
+
+
+class FramePool():
+    """
+    帧缓冲池。后端直接把截图写入池中的缓冲区，避免每帧重新分配内存。
+    """
+
+    def __init__(self, max_free=4):
+        """
+        Args:
+            max_free (int, optional): 每种形状最多保留的空闲缓冲区数量. Defaults to 4.
+        """
+        self.max_free = max_free
+        self.lock = threading.Lock()
+        self._free = {}
+        # 分配计数器，稳定截图时alloc_times不应再增长
+        self.alloc_times = 0
+        self.alloc_bytes = 0
+        self.reuse_times = 0
+        self.drop_times = 0
+        self.in_use = 0
+
+    def get(self, shape, dtype='uint8') -> PooledBuffer:
+        """取出一块缓冲区，引用计数为1。
+
+        Args:
+            shape (tuple): 数组形状
+            dtype (str, optional): 数据类型. Defaults to 'uint8'.
+
+        Returns:
+            PooledBuffer: 缓冲区
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self.lock:
+            free_list = self._free.get(key)
+            if free_list:
+                buf = free_list.pop()
+                self.reuse_times += 1
+            else:
+                buf = None
+            self.in_use += 1
+        if buf is None:
+            buf = PooledBuffer(self, shape, dtype)
+            with self.lock:
+                self.alloc_times += 1
+                self.alloc_bytes += buf.array.nbytes
+        buf.ref_count = 1
+        return buf
+
+    def _release(self, buf: PooledBuffer):
+        with self.lock:
+            buf.ref_count -= 1
+            if buf.ref_count > 0:
+                return
+            if buf.ref_count < 0:
+                raise ValueError("PooledBuffer released more times than acquired")
+            self.in_use -= 1
+            free_list = self._free.setdefault(buf.key, [])
+            if len(free_list) < self.max_free:
+                free_list.append(buf)
+            else:
+                self.drop_times += 1
+
+    def clear(self):
+        """丢弃所有空闲缓冲区。
+        """
+        with self.lock:
+            self._free = {}
+
+    def counters(self) -> dict:
+        """分配计数器快照。
+
+        Returns:
+            dict: alloc_times, alloc_bytes, reuse_times, drop_times, in_use, free
+        """
+        with self.lock:
+            return {
+                'alloc_times': self.alloc_times,
+                'alloc_bytes': self.alloc_bytes,
+                'reuse_times': self.reuse_times,
+                'drop_times': self.drop_times,
+                'in_use': self.in_use,
+                'free': sum(len(i) for i in self._free.values()),
+            }
@@ -0,0 +1,202 @@
+import json
+import os
+import queue
+import threading
+import zlib
+
+import numpy as np
+
+from source.interaction.frame import Frame
+
+META_FILE = 'record.json'
+RAW_FILE = 'frames.raw'
+INDEX_FILE = 'index.bin'
+ZLIB_FILE = 'frames.zlib'
+# 每帧一条索引; zoffset/zsize为压缩数据在frames.zlib中的位置，未压缩时zsize为0
+INDEX_DTYPE = np.dtype([('frame_id', '<i8'), ('timestamp', '<f8'), ('zoffset', '<i8'), ('zsize', '<i8')])
+
+
+class FrameRecorder():
+    """
+    截图录制器。帧写入预分配的内存映射文件，并记录frame_id/时间戳索引。
+    append只把Frame放入队列，拷贝和压缩都在后台线程完成，不影响截图帧率。
+    """
+
+    def __init__(self, path: str, shape=(1080, 1920, 4), capacity=1000, compress=False, compress_level=1,
+                 keep_raw=True, queue_size=16):
+        """
+        Args:
+            path (str): 录制文件夹
+            shape (tuple, optional): 帧的形状. Defaults to (1080, 1920, 4).
+            capacity (int, optional): 最多录制的帧数，文件按此预分配. Defaults to 1000.
+            compress (bool, optional): 是否在后台用zlib无损压缩. Defaults to False.
+            compress_level (int, optional): zlib压缩等级. Defaults to 1.
+            keep_raw (bool, optional): 压缩时close后是否保留未压缩的文件. Defaults to True.
+            queue_size (int, optional): 等待写入的最大帧数，写入跟不上时丢弃新帧. Defaults to 16.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.shape = tuple(shape)
+        self.capacity = capacity
+        self.compress = compress
+        self.compress_level = compress_level
+        self.keep_raw = keep_raw
+        self.data = np.memmap(os.path.join(path, RAW_FILE), dtype='uint8', mode='w+', shape=(capacity,) + self.shape)
+        self.index = np.memmap(os.path.join(path, INDEX_FILE), dtype=INDEX_DTYPE, mode='w+', shape=(capacity,))
+        self.count = 0
+        self.drop_times = 0
+        self.closed = False
+        self._next_slot = 0
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._compress_queue = queue.Queue()
+        self._write_thread = threading.Thread(target=self._write_loop, daemon=True, name='FrameRecorderWrite')
+        self._write_thread.start()
+        self._compress_thread = None
+        if compress:
+            self._zfile = open(os.path.join(path, ZLIB_FILE), 'wb')
+            self._zoffset = 0
+            self._compress_thread = threading.Thread(target=self._compress_loop, daemon=True,
+                                                     name='FrameRecorderCompress')
+            self._compress_thread.start()
+
+    def append(self, frame: Frame) -> bool:
+        """录制一帧。
+
+        Args:
+            frame (Frame): 截图帧，形状需要与shape一致
+
+        Returns:
+            bool: 是否加入录制队列。录制已满、已关闭或队列已满时返回False
+        """
+        if self.closed or self._next_slot >= self.capacity:
+            return False
+        if frame.shape != self.shape:
+            raise ValueError(f"frame shape {frame.shape} != recorder shape {self.shape}")
+        try:
+            self._write_queue.put_nowait((self._next_slot, frame))
+        except queue.Full:
+            self.drop_times += 1
+            return False
+        self._next_slot += 1
+        return True
+
+    def _write_loop(self):
+        while 1:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            slot, frame = item
+            self.data[slot] = frame.array
+            self.index[slot] = (frame.frame_id, frame.timestamp, 0, 0)
+            self.count = slot + 1
+            if self.compress:
+                self._compress_queue.put(slot)
+
+    def _compress_loop(self):
+        while 1:
+            slot = self._compress_queue.get()
+            if slot is None:
+                break
+            blob = zlib.compress(self.data[slot].tobytes(), self.compress_level)
+            self._zfile.write(blob)
+            self.index[slot]['zoffset'] = self._zoffset
+            self.index[slot]['zsize'] = len(blob)
+            self._zoffset += len(blob)
+
+    def close(self):
+        """等待队列写完，写入元数据并关闭文件。
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._write_queue.put(None)
+        self._write_thread.join()
+        if self._compress_thread is not None:
+            self._compress_queue.put(None)
+            self._compress_thread.join()
+            self._zfile.close()
+        self.data.flush()
+        self.index.flush()
+        meta = {
+            'shape': list(self.shape),
+            'capacity': self.capacity,
+            'count': self.count,
+            'compress': self.compress,
+            'raw': self.keep_raw or not self.compress,
+        }
+        with open(os.path.join(self.path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        del self.data
+        if not meta['raw']:
+            os.remove(os.path.join(self.path, RAW_FILE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FrameReader():
+    """
+    读取FrameRecorder录制的文件。未压缩时通过内存映射零拷贝随机访问任意一帧。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.shape = tuple(self.meta['shape'])
+        self.count = self.meta['count']
+        index = np.memmap(os.path.join(path, INDEX_FILE), dtype=INDEX_DTYPE, mode='r',
+                          shape=(self.meta['capacity'],))
+        self.index = index[:self.count]
+        self.data = None
+        self._zfile = None
+        if self.meta['raw']:
+            self.data = np.memmap(os.path.join(path, RAW_FILE), dtype='uint8', mode='r',
+                                  shape=(self.meta['capacity'],) + self.shape)
+        else:
+            self._zfile = open(os.path.join(path, ZLIB_FILE), 'rb')
+            self._zlock = threading.Lock()
+
+    @staticmethod
+    def is_record(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, META_FILE))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """第i帧。未压缩时返回只读的内存映射视图。
+        """
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        if self.data is not None:
+            return self.data[i]
+        zoffset, zsize = int(self.index[i]['zoffset']), int(self.index[i]['zsize'])
+        with self._zlock:
+            self._zfile.seek(zoffset)
+            blob = self._zfile.read(zsize)
+        return np.frombuffer(zlib.decompress(blob), dtype='uint8').reshape(self.shape)
+
+    def find(self, frame_id: int) -> int:
+        """frame_id对应的下标，不存在时返回-1。
+        """
+        i = int(np.searchsorted(self.index['frame_id'], frame_id))
+        if i < self.count and self.index[i]['frame_id'] == frame_id:
+            return i
+        return -1
+
+    def at_time(self, timestamp: float) -> int:
+        """timestamp时刻正在显示的帧的下标。
+        """
+        i = int(np.searchsorted(self.index['timestamp'], timestamp, side='right')) - 1
+        return max(i, 0)
+
+    def close(self):
+        self.data = None
+        if self._zfile is not None:
+            self._zfile.close()
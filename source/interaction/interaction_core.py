@@ -2,17 +2,22 @@ import ctypes
 import inspect
 import math
 import random
+import os
 import threading
 import time
-from asyncio.log import logger
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 
 from source.common import static_lib
+from source.interaction.fft_match import FFTMatcher
+from source.interaction.frame import RegionFrame
+from source.interaction.frame_cache import FrameViewCache
+from source.interaction.watcher import Watcher, WATCH_APPEAR, WATCH_DISAPPEAR
 from source.manager.button_manager import Button
-from source.manager.img_manager import ImgIcon
-from source.test.util import euclidean_distance_plist, crop
+from source.manager.img_manager import ImgIcon, CompiledTemplate, color_hist, spread_hist
+from source.util import crop, logger
 
 IMG_RATE = 0
 IMG_POSI = 1
@@ -20,10 +25,132 @@ IMG_POINT = 2
 IMG_RECT = 3
 IMG_BOOL = 4
 IMG_BOOLRATE = 5
+IMG_PEAKS = 6
+
+# match_many的返回值，每个icon一条
+MATCH_DTYPE = np.dtype([('score', 'f4'), ('x', 'i4'), ('y', 'i4'), ('found', '?')])
+# find_peaks/match_multiple_img(ret_mode=IMG_PEAKS)的返回值，按score从大到小排列
+PEAK_DTYPE = np.dtype([('x', 'i4'), ('y', 'i4'), ('score', 'f4')])
 
 winname_default = ["Genshin Impact", "原神"]
 
 
+def to_gray(img):
+    """BGR/BGRA图片转灰度图，已是灰度图时原样返回。
+    """
+    if len(img.shape) == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+
+def as_compiled(template):
+    """ImgIcon/Button/CompiledTemplate返回预处理后的模板，ndarray返回None。
+    """
+    if isinstance(template, ImgIcon):
+        return template.compiled
+    if isinstance(template, CompiledTemplate):
+        return template
+    return None
+
+
+# 金字塔匹配中，模板缩小后的最小边长。模板太小时自动降低层数
+PYRAMID_MIN_TEMPLATE = 8
+
+
+def pyramid_down(img, level: int):
+    """将图片缩小为1/2**level。
+    """
+    if level <= 0:
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, (max(w >> level, 1), max(h >> level, 1)), interpolation=cv2.INTER_AREA)
+
+
+def usable_pyramid_level(img, template, level: int) -> int:
+    """模板或图片缩小后过小时降低层数，返回实际可用的层数。
+    """
+    th, tw = template.shape[:2]
+    h, w = img.shape[:2]
+    while level > 0:
+        if min(th, tw) >> level >= PYRAMID_MIN_TEMPLATE and h >> level >= th >> level and w >> level >= tw >> level:
+            break
+        level -= 1
+    return level
+
+
+def match_ccorr(img, template, mask=None):
+    """cv2.matchTemplate(TM_CCORR_NORMED)，有掩码时把全黑窗口的0/0置为0。
+    """
+    res = cv2.matchTemplate(img, template, cv2.TM_CCORR_NORMED, mask=mask)
+    if mask is not None:
+        np.nan_to_num(res, copy=False, nan=0, posinf=0, neginf=0)
+    return res
+
+
+def match_window(img, template, x0, y0, x1, y1, mask=None):
+    """只在匹配结果的[x0,x1]x[y0,y1]范围内做全分辨率匹配。
+
+    Returns:
+        numpy.ndarray: 该范围内的匹配结果
+    """
+    th, tw = template.shape[:2]
+    return match_ccorr(img[y0:y1 + th, x0:x1 + tw], template, mask)
+
+
+def find_peaks(res, threshold, min_distance=15, top_k=None):
+    """从匹配结果中找出峰值。
+    先用3x3膨胀保留局部最大值，再按score从大到小贪心选取，与已选峰值距离小于min_distance的舍弃。
+
+    Args:
+        res (numpy.ndarray): cv2.matchTemplate的结果
+        threshold (float): 最小匹配度
+        min_distance (int, optional): 峰值间的最小距离，0时不做抑制. Defaults to 15.
+        top_k (int, optional): 最多返回的峰值数量，None为不限制. Defaults to None.
+
+    Returns:
+        numpy.ndarray: PEAK_DTYPE结构数组
+    """
+    local_max = cv2.dilate(res, np.ones((3, 3), dtype='uint8'))
+    ys, xs = np.nonzero((res >= threshold) & (res >= local_max))
+    scores = res[ys, xs]
+    order = np.argsort(-scores, kind='stable')
+    xs, ys, scores = xs[order], ys[order], scores[order]
+
+    if min_distance > 0 and len(scores) > 1:
+        # 按min_distance划分网格，只需检查相邻的9个格子
+        d2 = min_distance * min_distance
+        grid = {}
+        keep = []
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            gx, gy = x // min_distance, y // min_distance
+            close = False
+            for nx in (gx - 1, gx, gx + 1):
+                for ny in (gy - 1, gy, gy + 1):
+                    for px, py in grid.get((nx, ny), ()):
+                        if (px - x) ** 2 + (py - y) ** 2 < d2:
+                            close = True
+                            break
+                    if close:
+                        break
+                if close:
+                    break
+            if close:
+                continue
+            grid.setdefault((gx, gy), []).append((x, y))
+            keep.append(i)
+            if top_k is not None and len(keep) >= top_k:
+                break
+        xs, ys, scores = xs[keep], ys[keep], scores[keep]
+
+    if top_k is not None:
+        xs, ys, scores = xs[:top_k], ys[:top_k], scores[:top_k]
+    ret = np.empty(len(scores), dtype=PEAK_DTYPE)
+    ret['x'] = xs
+    ret['y'] = ys
+    ret['score'] = scores
+    return ret
+
+
 def before_operation(print_log=True):
     def outwrapper(func):
         def wrapper(*args, **kwargs):
@@ -40,20 +167,6 @@ def before_operation(print_log=True):
     return outwrapper
 
 
-GetDC = ctypes.windll.user32.GetDC
-CreateCompatibleDC = ctypes.windll.gdi32.CreateCompatibleDC
-GetClientRect = ctypes.windll.user32.GetClientRect
-CreateCompatibleBitmap = ctypes.windll.gdi32.CreateCompatibleBitmap
-SelectObject = ctypes.windll.gdi32.SelectObject
-BitBlt = ctypes.windll.gdi32.BitBlt
-SRCCOPY = 0x00CC0020
-GetBitmapBits = ctypes.windll.gdi32.GetBitmapBits
-DeleteObject = ctypes.windll.gdi32.DeleteObject
-ReleaseDC = ctypes.windll.user32.ReleaseDC
-PostMessageW = ctypes.windll.user32.PostMessageW
-MapVirtualKeyW = ctypes.windll.user32.MapVirtualKeyW
-
-
 class InteractionBGD:
     """
     default size:1920x1080
@@ -61,7 +174,12 @@ class InteractionBGD:
     thanks for https://zhuanlan.zhihu.com/p/361569101
     """
 
-    def __init__(self):
+    def __init__(self, capture_backend='windows', **capture_kwargs):
+        """
+        Args:
+            capture_backend (str, optional): 截图后端名称，见capture.CAPTURE_BACKENDS. Defaults to 'windows'.
+            **capture_kwargs: 传给截图后端的参数，例如回放后端的source, fps。
+        """
         logger.info("InteractionBGD created")
         self.WHEEL_DELTA = 120
         self.DEFAULT_DELAY_TIME = 0.05
@@ -70,16 +188,71 @@ class InteractionBGD:
         self.itt_exec = None
         self.capture_obj = None
         self.operation_lock = threading.Lock()
-        if True:
+        if capture_backend == 'windows':
             import source.interaction.interaction_normal
             self.itt_exec = source.interaction.interaction_normal.InteractionNormal()
+        else:
+            # 无窗口的后端没有可操作的目标，鼠标键盘操作为空操作
+            from source.interaction.interaction_template import InteractionTemplate
+            self.itt_exec = InteractionTemplate()
 
         if True:
-            from source.interaction.capture import WindowsCapture
-            self.capture_obj = WindowsCapture()
+            from source.interaction.capture import get_capture
+            self.capture_obj = get_capture(capture_backend, **capture_kwargs)
 
         self.key_status = {'w': False}
         self.key_freeze = {}
+        # 搜索区域的分块(crc32)没有变化时复用上次的匹配结果。开启后每帧都要计算整帧的分块校验和，默认关闭
+        self.reuse_unchanged_match = False
+        self.match_reuse_cache = {}
+        self.match_reuse_times = 0
+        # 同一帧内匹配结果的缓存，键为(id(imgicon), is_gray)，帧编号变化时清空
+        self.match_memo = {}
+        self.match_memo_frame_id = None
+        self.match_memo_hits = 0
+        self.match_memo_misses = 0
+        self.match_memo_lock = threading.Lock()
+        # 同一帧同一区域的jpgmode/灰度转换只做一次
+        self.view_cache = FrameViewCache()
+        # png2jpg的掩码缓冲区，按线程和图片大小复用
+        self.png2jpg_local = threading.local()
+        # match_many的线程池，第一次使用时创建
+        self.match_workers = os.cpu_count() or 1
+        self.match_executor = None
+        self.match_executor_lock = threading.Lock()
+        # 金字塔匹配，0为关闭。similar_img的pyramid_level为None时使用。
+        # 多目标匹配始终为全分辨率: TM_CCORR_NORMED在缩小的图中区分度太低，候选过多，实测几乎总是退回全分辨率匹配
+        self.pyramid_level = 0
+        # 粗匹配(TM_CCOEFF_NORMED)候选的最低匹配度，没有候选时退回全分辨率匹配
+        self.pyramid_threshold = 0.8
+        # 粗匹配候选超过该数量时认为粗匹配没有区分度，退回全分辨率匹配
+        self.pyramid_candidates = 16
+        # 细化后的最高匹配度低于该值时认为候选不可信，退回全分辨率匹配。similar_img给出threshold时使用threshold
+        self.pyramid_confirm_threshold = 0.91
+        self.pyramid_times = 0
+        self.pyramid_fallback_times = 0
+        # 全分辨率匹配的计算方法: 'auto'按代价模型在cv2.matchTemplate与FFT间选择, 'spatial'或'fft'
+        self.match_method = 'auto'
+        self.fft_matcher = FFTMatcher()
+        # 搜索区域只比模板大几个像素(黑色背景图片的±offset)时直接计算各位置的匹配度，见_match_fixed。
+        # fixed_max_offset为可走此路径的最大偏移，0为关闭
+        self.fixed_max_offset = 8
+        # 固定位置时先检查截图与模板是否完全相同
+        self.fixed_exact = True
+        self.fixed_times = 0
+        # 跟踪模式: 记住icon上次的位置和速度，先在预测位置附近的小窗口中匹配，没有找到时再搜索整个区域
+        self.tracking = False
+        # 窗口在预测位置四周扩展的像素数，另加上一帧的位移
+        self.track_margin = 16
+        self.track_states = {}
+        self.track_hits = 0
+        self.track_misses = 0
+        # 匹配前用探针像素和颜色直方图排除明显不匹配的区域。
+        # TM_CCORR_NORMED对亮度相近、颜色不同的区域也可能给出高匹配度，开启后这类区域会被排除，默认关闭
+        self.prefilter = False
+        # 按icon名称统计的预筛选次数与耗时，见prefilter_report
+        self.prefilter_stats = {}
+        self.prefilter_lock = threading.Lock()
 
     def capture(self, posi=None, shape='yx', jpgmode=None, check_shape=True):
         """窗口客户区截图
@@ -96,10 +269,33 @@ class InteractionBGD:
             numpy.ndarray: 图片数组
         """
 
-        ret = self.capture_obj.capture()
+        if posi is None:
+            return self._convert_jpgmode(self.capture_obj.capture(), jpgmode)
+        if self.capture_obj.will_capture_roi([posi]):
+            # 当前帧已过期，只截取并转换需要的区域
+            frame = self.capture_obj.capture_region_frame()
+        else:
+            frame = self.capture_frame()
+        # 同一帧同一区域的转换只计算一次，返回可写的拷贝
+        return self.frame_view(frame, posi, jpgmode).copy()
+
+    def capture_regions(self, posi_list, jpgmode=None):
+        """截取多个区域，只转换这些区域内的像素
 
-        if posi is not None:
-            ret = crop(ret, posi)
+        Args:
+            posi_list (list[[x1,y1,x2,y2], ...]): 截图区域列表
+            jpgmode (int, optional): 同capture. Defaults to None.
+
+        Returns:
+            list[numpy.ndarray]: 图片数组列表
+        """
+        if self.capture_obj.will_capture_roi(posi_list):
+            frame = self.capture_obj.capture_region_frame()
+        else:
+            frame = self.capture_frame()
+        return [self.frame_view(frame, posi, jpgmode).copy() for posi in posi_list]
+
+    def _convert_jpgmode(self, ret, jpgmode):
         if ret.shape[2] == 3:
             pass
         elif jpgmode == 0:
@@ -112,60 +308,115 @@ class InteractionBGD:
             ret = ret[:, :, :3]
         return ret
 
+    def capture_frame(self, is_next_img=False):
+        """获得共享的只读截图帧，不拷贝。需要可写数组时使用Frame.copy()。
+
+        Args:
+            is_next_img (bool, optional): 强制截取下一张图片. Defaults to False.
+
+        Returns:
+            Frame: 截图帧
+        """
+        return self.capture_obj.capture(is_next_img=is_next_img, as_frame=True)
+
     def match_multiple_img(self, img, template, is_gray=False, is_show_res: bool = False, ret_mode=IMG_POINT,
-                           threshold=0.98, ignore_close=False):
+                           threshold=0.98, ignore_close=False, min_distance=15, top_k=None):
         """多图片识别
 
         Args:
             img (numpy): 截图Mat
-            template (numpy): 要匹配的样板图片
+            template (numpy/CompiledTemplate/ImgIcon): 要匹配的样板图片，传入预处理后的模板时不再转换
             is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
             is_show_res (bool, optional): 结果显示. Defaults to False.
-            ret_mode (int, optional): 返回值模式,目前只有IMG_POINT. Defaults to IMG_POINT. 
+            ret_mode (int, optional): 返回值模式,IMG_POINT或IMG_PEAKS. Defaults to IMG_POINT. 
             threshold (float, optional): 最小匹配度. Defaults to 0.98.
+            ignore_close (bool, optional): IMG_POINT模式下是否去除距离过近的坐标. Defaults to False.
+            min_distance (int, optional): 去除距离过近的坐标时的最小距离. Defaults to 15.
+            top_k (int, optional): 最多返回的坐标数量，None为不限制. Defaults to None.
 
         Returns:
-            list[list[], ...]: 匹配成功的坐标列表
+            list[list[], ...]/numpy.ndarray: 匹配成功的坐标列表，按匹配度从大到小排列。IMG_PEAKS时为PEAK_DTYPE结构数组
         """
+        compiled = as_compiled(template)
+        if compiled is not None:
+            template = compiled.image(is_gray)
+        elif is_gray:
+            template = to_gray(template)
         if is_gray:
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-            template = cv2.cvtColor(template, cv2.COLOR_BGRA2GRAY)
-        res = cv2.matchTemplate(img, template, cv2.TM_CCORR_NORMED)
-
-        loc = np.where(res >= threshold)  # 匹配结果小于阈值的位置
+            img = to_gray(img)
+        res = self.match_template(img, template, *self._compiled_args(compiled, is_gray))
 
-        matched_coordinates = sorted(zip(*loc[::-1]), key=lambda x: res[x[1], x[0]], reverse=True)
+        if ret_mode == IMG_PEAKS:
+            return find_peaks(res, threshold, min_distance=min_distance, top_k=top_k)
         if ignore_close:
-            ret_coordinates = []
-            for i in matched_coordinates:
-                if len(ret_coordinates) == 0:
-                    ret_coordinates.append(i)
-                    continue
-                if min(euclidean_distance_plist(i, ret_coordinates)) >= 15:
-                    ret_coordinates.append(i)
-            return ret_coordinates
-
-        return matched_coordinates
-
-    def similar_img(self, img, target, is_gray=False, is_show_res: bool = False, ret_mode=IMG_RATE):
+            peaks = find_peaks(res, threshold, min_distance=min_distance, top_k=top_k)
+            return list(zip(peaks['x'].tolist(), peaks['y'].tolist()))
+
+        ys, xs = np.nonzero(res >= threshold)  # 匹配结果不小于阈值的位置
+        order = np.argsort(-res[ys, xs], kind='stable')[:top_k]
+        return list(zip(xs[order].tolist(), ys[order].tolist()))
+
+    def match_template(self, img, template, template_norm=None, mask=None, img_key=None):
+        """全分辨率TM_CCORR_NORMED匹配，按self.match_method选择cv2.matchTemplate或FFT。
+
+        Args:
+            template_norm (float, optional): 预先计算的sum(T^2). Defaults to None.
+            mask (numpy.ndarray, optional): 模板的uint8掩码，只有非0的像素参与匹配. Defaults to None.
+            img_key (hashable, optional): img内容的唯一标识，如(帧编号, 区域, jpgmode, is_gray)。
+                给出时多个模板共用img的频谱与归一化系数，为None时不缓存. Defaults to None.
+
+        Returns:
+            numpy.ndarray: 匹配结果
+        """
+        return self.fft_matcher.match_template(img, template, method=self.match_method, template_norm=template_norm,
+                                               mask=mask, img_key=img_key)
+
+    @staticmethod
+    def _compiled_args(compiled, is_gray):
+        """match_template的template_norm与mask参数"""
+        if compiled is None:
+            return None, None
+        return compiled.norm(is_gray), compiled.mask
+
+    def similar_img(self, img, target, is_gray=False, is_show_res: bool = False, ret_mode=IMG_RATE,
+                    pyramid_level=None, img_key=None, img_pyramid=None, threshold=None):
         """单个图片匹配
 
         Args:
             img (numpy): Mat
-            template (numpy): 要匹配的样板图片
+            template (numpy/CompiledTemplate/ImgIcon): 要匹配的样板图片，传入预处理后的模板时不再转换
             is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
             is_show_res (bool, optional): 结果显示. Defaults to False.
             ret_mode (int, optional): 返回值模式. Defaults to IMG_RATE.
+            pyramid_level (int, optional): 金字塔匹配层数，0为关闭，None时使用self.pyramid_level. Defaults to None.
+            img_key (hashable, optional): 同match_template. Defaults to None.
+            img_pyramid (callable, optional): 参数为层数，返回img的该层金字塔和偏移，见frame_pyramid。
+                为None时由img缩小. Defaults to None.
+            threshold (float, optional): 匹配度阈值。金字塔匹配细化后的匹配度低于阈值时退回全分辨率匹配确认. Defaults to None.
 
         Returns:
             float/(float, list[]): 匹配度或者匹配度和它的坐标
         """
+        compiled = as_compiled(target)
+        if compiled is not None:
+            target = compiled.image(is_gray)
+        elif is_gray:
+            target = to_gray(target)
         if is_gray:
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-            target = cv2.cvtColor(target, cv2.COLOR_BGRA2GRAY)
+            img = to_gray(img)
+        if pyramid_level is None:
+            pyramid_level = self.pyramid_level
+        if pyramid_level > 0:
+            ret = self._similar_pyramid(img, target, pyramid_level, compiled, is_gray, img_pyramid, threshold)
+            if ret is not None:
+                matching_rate, max_loc = ret
+                if ret_mode == IMG_RATE:
+                    return matching_rate
+                elif ret_mode == IMG_POSI:
+                    return matching_rate, max_loc
         # 模板匹配，将alpha作为mask，TM_CCORR_NORMED方法的计算结果范围为[0, 1]，越接近1越匹配
         # img_manager.qshow(img)
-        result = cv2.matchTemplate(img, target, cv2.TM_CCORR_NORMED)  # TM_CCOEFF_NORMED
+        result = self.match_template(img, target, *self._compiled_args(compiled, is_gray), img_key=img_key)
         # 获取结果中最大值和最小值以及他们的坐标
         min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
         if is_show_res:
@@ -178,6 +429,432 @@ class InteractionBGD:
         elif ret_mode == IMG_POSI:
             return matching_rate, max_loc
 
+    def _similar_pyramid(self, img, target, level, compiled=None, is_gray=False, img_pyramid=None, threshold=None):
+        """金字塔匹配: 在缩小的图片中找出全部候选位置，只在候选附近做全分辨率匹配。
+        有compiled时使用其缓存的缩小模板；有img_pyramid时使用帧缓存的缩小图像。
+        候选过多或细化后的匹配度低于threshold(为None时为pyramid_confirm_threshold)时，结果不可信，退回全分辨率匹配。
+
+        Returns:
+            (float, tuple)/None: 匹配度和坐标。粗匹配没有可信的候选时返回None，由调用者做全分辨率匹配
+        """
+        level = usable_pyramid_level(img, target, level)
+        if level == 0:
+            return None
+        self.pyramid_times += 1
+        small = compiled.pyramid(level, is_gray) if compiled is not None else pyramid_down(target, level)
+        tpl_mask = compiled.mask if compiled is not None else None
+        small_mask = compiled.pyramid_mask(level) if compiled is not None else None
+        small_img, (dx, dy) = img_pyramid(level) if img_pyramid is not None else (pyramid_down(img, level), (0, 0))
+        if small_img.shape[0] < small.shape[0] or small_img.shape[1] < small.shape[1]:
+            self.pyramid_fallback_times += 1
+            return None
+        # 粗匹配用去均值的TM_CCOEFF_NORMED: 缩小后TM_CCORR_NORMED在大部分位置都接近1，没有区分度。
+        # 细化仍用TM_CCORR_NORMED，结果与全分辨率匹配一致
+        coarse = cv2.matchTemplate(small_img, small, cv2.TM_CCOEFF_NORMED, mask=small_mask)
+        np.nan_to_num(coarse, copy=False, nan=0, posinf=0, neginf=0)
+        th, tw = target.shape[:2]
+        rh, rw = img.shape[0] - th, img.shape[1] - tw
+        # 粗匹配的一个像素对应原图2**level个像素，再留1个像素的误差
+        r = (1 << level) + 1
+        suppress = max(min(th, tw) >> (level + 1), 1)
+        candidates = []
+        while True:
+            _, val, _, (cx, cy) = cv2.minMaxLoc(coarse)
+            if val < self.pyramid_threshold:
+                break
+            if len(candidates) == self.pyramid_candidates:
+                # 候选过多，粗匹配没有区分度
+                self.pyramid_fallback_times += 1
+                return None
+            candidates.append((cx, cy))
+            coarse[max(cy - suppress, 0):cy + suppress + 1, max(cx - suppress, 0):cx + suppress + 1] = -1
+        # 细化每一个候选，取全分辨率匹配度最高的
+        best = None
+        for cx, cy in candidates:
+            cx, cy = (cx << level) - dx, (cy << level) - dy
+            x0, y0 = max(cx - r, 0), max(cy - r, 0)
+            x1, y1 = min(cx + r, rw), min(cy + r, rh)
+            if x1 < x0 or y1 < y0:
+                continue
+            _, fine_val, _, (fx, fy) = cv2.minMaxLoc(match_window(img, target, x0, y0, x1, y1, tpl_mask))
+            if best is None or fine_val > best[0]:
+                best = (fine_val, (x0 + fx, y0 + fy))
+        if threshold is None:
+            threshold = self.pyramid_confirm_threshold
+        if best is not None and best[0] < threshold:
+            best = None
+        if best is None:
+            self.pyramid_fallback_times += 1
+        return best
+
+    def frame_view(self, frame, posi=None, jpgmode=None, is_gray=False):
+        """frame中posi区域经过jpgmode和灰度转换后的图像。同一帧同一区域的转换只计算一次。
+
+        Args:
+            frame (Frame/RegionFrame): 截图帧。RegionFrame时只截取posi区域
+            posi ([x1,y1,x2,y2], optional): 区域，None为整帧，RegionFrame时不能为None. Defaults to None.
+            jpgmode (int, optional): 同capture. Defaults to None.
+            is_gray (bool, optional): 是否转为灰度图. Defaults to False.
+
+        Returns:
+            numpy.ndarray: 只读数组
+        """
+
+        def compute():
+            if isinstance(frame, RegionFrame):
+                # 区域截图由RegionFrame持有，不会被复用
+                img = self._convert_jpgmode(frame.region(posi), jpgmode)
+                return np.ascontiguousarray(to_gray(img) if is_gray else img)
+            src = crop(frame.array, posi) if posi is not None else frame.array
+            img = self._convert_jpgmode(src, jpgmode)
+            if is_gray:
+                img = to_gray(img)
+            # 帧的缓冲区会被复用，缓存的图像不能引用它
+            if np.shares_memory(img, frame.array):
+                return img.copy()
+            return np.ascontiguousarray(img)
+
+        return self.view_cache.get(frame.frame_id, posi, (jpgmode, is_gray), compute)
+
+    def frame_pyramid(self, frame, level, posi=None, jpgmode=None, is_gray=False):
+        """frame中posi区域经过jpgmode和灰度转换后的第level层金字塔，同一帧只缩小一次。
+        jpgmode为None或0时从Frame.pyramid中裁剪，同一帧的各个区域共用整帧的金字塔；
+        其他jpgmode或RegionFrame需要先转换，缩小转换后的区域并缓存。
+
+        Args:
+            frame (Frame/RegionFrame): 截图帧
+            level (int): 金字塔层数
+            posi ([x1,y1,x2,y2], optional): 区域，None为整帧. Defaults to None.
+            jpgmode (int, optional): 同capture. Defaults to None.
+            is_gray (bool, optional): 是否为灰度图. Defaults to False.
+
+        Returns:
+            (numpy.ndarray, (int, int)): 只读的缩小图像，以及区域左上角相对缩小图像左上角的偏移(原图像素)
+        """
+        if not isinstance(frame, RegionFrame) and (jpgmode in (None, 0) or frame.shape[2] == 3):
+            small = frame.pyramid(level, is_gray)
+            if not is_gray and jpgmode == 0:
+                small = small[:, :, :3]
+            if posi is None:
+                return small, (0, 0)
+            x1, y1, x2, y2 = map(int, map(round, posi))
+            sx, sy = max(x1, 0) >> level, max(y1, 0) >> level
+            return small[sy:max(y2, 0) >> level, sx:max(x2, 0) >> level], (x1 - (sx << level), y1 - (sy << level))
+
+        def compute():
+            return pyramid_down(self.frame_view(frame, posi, jpgmode, is_gray), level)
+
+        return self.view_cache.get(frame.frame_id, posi, ('pyramid', level, jpgmode, is_gray), compute), (0, 0)
+
+    def _similar_icon(self, imgicon: ImgIcon, ret_mode=IMG_RATE, is_gray=False):
+        """截图并匹配imgicon。
+        同一帧内重复查询同一icon时直接返回本帧的结果；开启reuse_unchanged_match时，搜索区域自上次匹配后没有变化则直接返回上次的结果。
+        当前帧已过期且后端支持区域截图时，只截取搜索区域(RegionFrame)，同一截图间隔内的查询共用一个帧编号。
+
+        Args:
+            imgicon (ImgIcon): imgicon对象
+            ret_mode (int, optional): 同similar_img. Defaults to IMG_RATE.
+            is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
+
+        Returns:
+            float/(float, list[]): 同similar_img
+        """
+        if not self.reuse_unchanged_match and self.capture_obj.will_capture_roi([imgicon.cap_posi]):
+            # 当前帧已过期，只截取搜索区域。区域截图没有分块校验和，不能复用上次的结果
+            frame = self.capture_obj.capture_region_frame()
+        else:
+            frame = self.capture_frame()
+        key = (id(imgicon), is_gray)
+        # 同时保存匹配度和坐标，IMG_RATE和IMG_POSI的查询共用一次匹配
+        ret = self._get_match_memo(frame.frame_id, key)
+        if ret is None:
+            cached = self.match_reuse_cache.get(key) if self.reuse_unchanged_match else None
+            if cached is not None and not self.capture_obj.region_changed(imgicon.cap_posi, cached[0], frame):
+                self.match_reuse_times += 1
+                ret = cached[1]
+            else:
+                if self.reuse_unchanged_match:
+                    # 记录本帧的分块校验和，下一帧据此判断区域是否变化
+                    self.capture_obj.tile_signature(frame)
+                cap = self.frame_view(frame, imgicon.cap_posi, imgicon.jpgmode, is_gray)
+                ret = None
+                if self.tracking:
+                    ret = self._match_tracked(imgicon, cap, frame.frame_id, is_gray)
+                if ret is None:
+                    ret = self._match_icon(
+                        imgicon, cap, is_gray,
+                        region_hist=lambda: self._region_hist(frame, imgicon.cap_posi, imgicon.jpgmode, is_gray, cap),
+                        img_key=(frame.frame_id, tuple(imgicon.cap_posi), imgicon.jpgmode, is_gray),
+                        img_pyramid=lambda level: self.frame_pyramid(frame, level, imgicon.cap_posi, imgicon.jpgmode,
+                                                                     is_gray))
+                    if self.tracking:
+                        self._update_track(imgicon, frame.frame_id, ret, is_gray)
+                if self.reuse_unchanged_match:
+                    self.match_reuse_cache[key] = (frame.frame_id, ret)
+            self._set_match_memo(frame.frame_id, key, ret)
+        if ret_mode == IMG_RATE:
+            return ret[0]
+        return ret
+
+    def _match_tracked(self, imgicon: ImgIcon, cap, frame_id, is_gray=False):
+        """在预测位置附近的窗口中匹配imgicon。
+
+        Returns:
+            (float, tuple)/None: 窗口中找到时返回匹配度和在cap中的坐标，否则为None
+        """
+        key = (id(imgicon), is_gray)
+        state = self.track_states.get(key)
+        if state is None:
+            return None
+        (x, y), (vx, vy), last_frame_id = state
+        dt = frame_id - last_frame_id
+        px, py = int(round(x + vx * dt)), int(round(y + vy * dt))
+        mx = self.track_margin + abs(px - x)
+        my = self.track_margin + abs(py - y)
+        th, tw = imgicon.compiled.shape[:2]
+        h, w = cap.shape[:2]
+        x0, y0 = max(px - mx, 0), max(py - my, 0)
+        x1, y1 = min(px + mx, w - tw), min(py + my, h - th)
+        if x1 < x0 or y1 < y0:
+            self.track_misses += 1
+            return None
+        rate, loc = self.similar_img(cap[y0:y1 + th, x0:x1 + tw], imgicon.compiled, is_gray=is_gray,
+                                     ret_mode=IMG_POSI, pyramid_level=0)
+        bx, by = loc[0] + x0, loc[1] + y0
+        # 最大值在窗口边上(且不是cap的边)时，真正的峰值可能在窗口外
+        on_edge = (bx == x0 and x0 > 0) or (bx == x1 and x1 < w - tw) or (by == y0 and y0 > 0) or (
+                by == y1 and y1 < h - th)
+        if rate < imgicon.threshold or on_edge:
+            self.track_misses += 1
+            return None
+        self.track_hits += 1
+        ret = (rate, (bx, by))
+        self._update_track(imgicon, frame_id, ret, is_gray)
+        return ret
+
+    def _update_track(self, imgicon: ImgIcon, frame_id, ret, is_gray=False):
+        """用本帧的匹配结果更新位置和每帧的位移，没有找到时清除。
+        """
+        key = (id(imgicon), is_gray)
+        rate, loc = ret
+        if rate < imgicon.threshold:
+            self.track_states.pop(key, None)
+            return
+        state = self.track_states.get(key)
+        velocity = (0., 0.)
+        if state is not None and frame_id > state[2]:
+            (x, y), _, last_frame_id = state
+            dt = frame_id - last_frame_id
+            velocity = ((loc[0] - x) / dt, (loc[1] - y) / dt)
+        self.track_states[key] = ((loc[0], loc[1]), velocity, frame_id)
+
+    def _region_hist(self, frame, posi, jpgmode, is_gray, cap):
+        """frame中区域的spread_hist(color_hist)，同一帧同一区域只计算一次。
+        """
+
+        def compute():
+            return spread_hist(color_hist(cap if is_gray or cap.shape[2] == 3 else cap[:, :, :3]))
+
+        return self.view_cache.get(frame.frame_id, posi, ('hist', jpgmode, is_gray), compute)
+
+    def _match_fixed(self, compiled: CompiledTemplate, cap, is_gray=False):
+        """搜索区域与模板大小相同或只大出不超过fixed_max_offset的边时的快速匹配。
+        大小相同时用CompiledTemplate.score_at直接计算；否则对少量位置直接调用cv2，不经过FFT的选择与缓存，
+        结果写入CompiledTemplate中复用的缓冲区。
+
+        Returns:
+            (float, tuple)/None: 匹配度和坐标，不适用时为None
+        """
+        th, tw = compiled.shape[:2]
+        h, w = cap.shape[:2]
+        dy, dx = h - th, w - tw
+        if dy < 0 or dx < 0 or max(dy, dx) > 2 * self.fixed_max_offset:
+            return None
+        if len(cap.shape) != len(compiled.image(is_gray).shape):
+            return None
+        self.fixed_times += 1
+        if dy == 0 and dx == 0:
+            return compiled.score_at(cap, is_gray, exact=self.fixed_exact), (0, 0)
+        if self.fixed_exact:
+            # 图标通常就在区域中心，完全相同时匹配度为1，已是最大值
+            cy, cx = dy // 2, dx // 2
+            center = cap[cy:cy + th, cx:cx + tw]
+            if cv2.norm(center, compiled.image(is_gray), cv2.NORM_INF, mask=compiled.mask) == 0 and compiled.norm(is_gray) > 0:
+                return 1., (cx, cy)
+        _, max_val, _, max_loc = cv2.minMaxLoc(compiled.match_small(cap, is_gray))
+        return max_val, max_loc
+
+    def _match_icon(self, imgicon: ImgIcon, cap, is_gray=False, region_hist=None, img_key=None, img_pyramid=None):
+        """在已转换的cap中匹配imgicon，开启prefilter时先做预筛选。
+
+        Args:
+            region_hist (callable, optional): 返回cap的直方图，用于共用同一区域的直方图. Defaults to None.
+            img_key (hashable, optional): 同match_template. Defaults to None.
+            img_pyramid (callable, optional): 同similar_img. Defaults to None.
+
+        Returns:
+            (float, tuple): 匹配度和坐标。被预筛选排除时为(0., (0, 0))
+        """
+        compiled = imgicon.compiled
+        ret = self._match_fixed(compiled, cap, is_gray)
+        if ret is not None:
+            return ret
+        if self.prefilter:
+            t = time.perf_counter()
+            passed = compiled.prefilter(cap, is_gray, region_hist() if region_hist is not None else None)
+            self._record_prefilter(imgicon.name, time.perf_counter() - t, not passed)
+            if not passed:
+                return 0., (0, 0)
+        t = time.perf_counter()
+        ret = self.similar_img(cap, compiled, is_gray=is_gray, ret_mode=IMG_POSI, img_key=img_key,
+                               img_pyramid=img_pyramid, threshold=imgicon.threshold)
+        self._record_prefilter(imgicon.name, match_time=time.perf_counter() - t)
+        return ret
+
+    def _record_prefilter(self, name, prefilter_time=0., rejected=False, match_time=None):
+        with self.prefilter_lock:
+            stats = self.prefilter_stats.get(name)
+            if stats is None:
+                stats = self.prefilter_stats[name] = {'checks': 0, 'rejects': 0, 'prefilter_time': 0.,
+                                                      'matches': 0, 'match_time': 0.}
+            if match_time is not None:
+                stats['matches'] += 1
+                stats['match_time'] += match_time
+                return
+            stats['checks'] += 1
+            stats['rejects'] += rejected
+            stats['prefilter_time'] += prefilter_time
+
+    def prefilter_report(self) -> dict:
+        """各icon的预筛选统计。节省的时间按被排除的次数乘以该icon的平均匹配耗时估计，减去预筛选本身的耗时。
+
+        Returns:
+            dict: {icon名称: {checks, rejects, reject_rate, prefilter_ms, match_ms(平均), saved_ms}}
+        """
+        ret = {}
+        with self.prefilter_lock:
+            for name, stats in self.prefilter_stats.items():
+                match_ms = stats['match_time'] / stats['matches'] * 1000 if stats['matches'] else None
+                ret[name] = {
+                    'checks': stats['checks'],
+                    'rejects': stats['rejects'],
+                    'reject_rate': stats['rejects'] / stats['checks'] if stats['checks'] else None,
+                    'prefilter_ms': stats['prefilter_time'] * 1000,
+                    'match_ms': match_ms,
+                    'saved_ms': (stats['rejects'] * match_ms if match_ms is not None else 0.)
+                                - stats['prefilter_time'] * 1000,
+                }
+        return ret
+
+    def _get_match_memo(self, frame_id, key):
+        with self.match_memo_lock:
+            if frame_id != self.match_memo_frame_id:
+                # 新的一帧，之前的结果全部失效
+                self.match_memo = {}
+                self.match_memo_frame_id = frame_id
+            ret = self.match_memo.get(key)
+            if ret is None:
+                self.match_memo_misses += 1
+            else:
+                self.match_memo_hits += 1
+            return ret
+
+    def _set_match_memo(self, frame_id, key, ret):
+        with self.match_memo_lock:
+            if self.match_memo_frame_id is None or frame_id > self.match_memo_frame_id:
+                self.match_memo = {}
+                self.match_memo_frame_id = frame_id
+            if frame_id == self.match_memo_frame_id:
+                self.match_memo[key] = ret
+
+    def match_counters(self) -> dict:
+        """匹配结果复用的计数。
+
+        Returns:
+            dict: memo_hits(同一帧内的重复查询), memo_misses, reuse_times(区域未变化时复用上次结果),
+                track_hits(跟踪窗口中找到), track_misses(跟踪窗口中没有找到，改为搜索整个区域),
+                fixed_times(固定位置快速匹配), pyramid_times(金字塔匹配次数),
+                pyramid_fallbacks(粗匹配没有可信候选、退回全分辨率匹配的次数)
+        """
+        with self.match_memo_lock:
+            return {
+                'memo_hits': self.match_memo_hits,
+                'memo_misses': self.match_memo_misses,
+                'reuse_times': self.match_reuse_times,
+                'track_hits': self.track_hits,
+                'track_misses': self.track_misses,
+                'fixed_times': self.fixed_times,
+                'pyramid_times': self.pyramid_times,
+                'pyramid_fallbacks': self.pyramid_fallback_times,
+            }
+
+    def _get_match_executor(self):
+        with self.match_executor_lock:
+            if self.match_executor is None:
+                self.match_executor = ThreadPoolExecutor(max_workers=self.match_workers,
+                                                         thread_name_prefix='MatchMany')
+            return self.match_executor
+
+    def match_many(self, icons, frame=None, is_gray=False):
+        """在同一帧中匹配多个imgicon。
+        相同搜索区域和jpgmode的icon共用一次裁剪与转换，matchTemplate在线程池中并行执行。
+
+        Args:
+            icons (list[ImgIcon]): imgicon列表
+            frame (Frame, optional): 截图帧，为None时截取最新的帧. Defaults to None.
+            is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
+
+        Returns:
+            numpy.ndarray: MATCH_DTYPE结构数组，与icons一一对应。x, y为在搜索区域中的坐标，found为score>=threshold
+        """
+        if frame is None:
+            frame = self.capture_frame()
+        ret = np.zeros(len(icons), dtype=MATCH_DTYPE)
+        if len(icons) == 0:
+            return ret
+
+        groups = {}
+        for i, imgicon in enumerate(icons):
+            key = (tuple(imgicon.cap_posi), imgicon.jpgmode)
+            groups.setdefault(key, []).append(i)
+
+        def get_view(key):
+            posi, jpgmode = key
+            return self.frame_view(frame, list(posi), jpgmode, is_gray)
+
+        def match(args):
+            key, cap, imgicon = args
+            compiled = imgicon.compiled
+            fixed = self._match_fixed(compiled, cap, is_gray)
+            if fixed is not None:
+                max_val, max_loc = fixed
+                return max_val, max_loc[0], max_loc[1], max_val >= imgicon.threshold
+            if self.prefilter:
+                t = time.perf_counter()
+                passed = compiled.prefilter(cap, is_gray, self._region_hist(frame, list(key[0]), key[1], is_gray, cap))
+                self._record_prefilter(imgicon.name, time.perf_counter() - t, not passed)
+                if not passed:
+                    return 0., 0, 0, False
+            t = time.perf_counter()
+            result = self.match_template(cap, compiled.image(is_gray), compiled.norm(is_gray), compiled.mask,
+                                         img_key=(frame.frame_id, key[0], key[1], is_gray))
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            self._record_prefilter(imgicon.name, match_time=time.perf_counter() - t)
+            return max_val, max_loc[0], max_loc[1], max_val >= imgicon.threshold
+
+        if len(icons) == 1:
+            key = next(iter(groups))
+            ret[0] = match((key, get_view(key), icons[0]))
+            return ret
+
+        executor = self._get_match_executor()
+        views = dict(zip(groups, executor.map(get_view, groups)))
+        tasks = [(key, views[key], icons[i]) for key, index in groups.items() for i in index]
+        order = [i for index in groups.values() for i in index]
+        for i, item in zip(order, executor.map(match, tasks)):
+            ret[i] = item
+        return ret
+
     def get_img_position(self, imgicon: ImgIcon, is_gray=False, is_log=False):
         """获得图片在屏幕上的坐标
 
@@ -194,9 +871,7 @@ class InteractionBGD:
         #     cap = self.capture()
         #     cap = self.png2jpg(cap, bgcolor='black', channel='ui', alpha_num=img_manager.alpha_dict[imgname])
         # else:
-        cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
-
-        matching_rate, max_loc = self.similar_img(cap, imgicon.image, ret_mode=IMG_POSI)
+        matching_rate, max_loc = self._similar_icon(imgicon, ret_mode=IMG_POSI, is_gray=is_gray)
 
         if imgicon.is_print_log(matching_rate >= imgicon.threshold):
             logger.debug(
@@ -222,10 +897,12 @@ class InteractionBGD:
         # 获取当前函数方法名称
         upper_func_name = inspect.getframeinfo(inspect.currentframe().f_back)[2]
 
-        if cap is None:
-            cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
-
-        matching_rate = self.similar_img(cap, imgicon.image)
+        if cap is None and not show_res:
+            matching_rate = self._similar_icon(imgicon, is_gray=is_gray)
+        else:
+            if cap is None:
+                cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
+            matching_rate = self.similar_img(cap, imgicon.compiled)
 
         if show_res:
             cv2.imshow(imgicon.name, cap)
@@ -273,12 +950,7 @@ class InteractionBGD:
                 logger.info(f"{inputvar.name} {inputvar.click_position}")
                 return False
 
-            cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
-
-            if inputvar.is_bbg == False:
-                matching_rate, click_posi = self.similar_img(imgicon.image, cap, is_gray=is_gray, ret_mode=IMG_POSI)
-            else:
-                matching_rate = self.similar_img(imgicon.image, cap, is_gray=is_gray)
+            matching_rate, click_posi = self._similar_icon(imgicon, ret_mode=IMG_POSI, is_gray=is_gray)
 
             if imgicon.is_print_log(matching_rate >= imgicon.threshold) or is_log:
                 logger.debug(
@@ -297,13 +969,11 @@ class InteractionBGD:
             else:
                 return False
 
-        elif isinstance(inputvar, img_manager.ImgIcon):
+        elif isinstance(inputvar, ImgIcon):
             imgicon = inputvar
             upper_func_name = inspect.getframeinfo(inspect.currentframe().f_back)[2]
 
-            cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
-
-            matching_rate = self.similar_img(imgicon.image, cap, is_gray=is_gray)
+            matching_rate = self._similar_icon(imgicon, is_gray=is_gray)
 
             if imgicon.is_print_log(matching_rate >= imgicon.threshold) or is_log:
                 logger.debug('imgname: ' + imgicon.name + 'matching_rate: ' + str(
@@ -320,20 +990,44 @@ class InteractionBGD:
 
     def appear_then_click_groups(self, verify_img: ImgIcon, inputvar_list: list, stop_func,
                                  verify_mode=False):
+        """点击inputvar_list中出现的每个对象，全部点击过后verify_img的存在状态等于verify_mode时返回。
+        每一帧新截图匹配一次全部对象，不再逐个截图轮询。
+
+        Args:
+            verify_img (ImgIcon): 验证用的imgicon
+            inputvar_list (list[ImgIcon/Button]): 要点击的对象
+            stop_func (callable): 返回True时停止
+            verify_mode (bool, optional): verify_img应存在(True)或不存在(False). Defaults to False.
+
+        Returns:
+            bool: 是否成功，stop_func返回True时为False
         """
-        Click each inputvar in list.
-        
-        """
-        succ_flags = [False for i in len(inputvar_list)]
-        while 1:
-            time.sleep(0.1)
-            if stop_func: return False
+        succ_flags = [False for i in range(len(inputvar_list))]
+        done = threading.Event()
+        watcher = Watcher(self)
+
+        def click(i):
+            def callback(event):
+                # 本帧的匹配结果已由watcher记录，appear_then_click不再重复匹配
+                if self.appear_then_click(inputvar_list[i]):
+                    succ_flags[i] = True
+            return callback
+
+        def verify(event):
             if all(succ_flags):
-                if self.get_img_existence(verify_img) == verify_mode:
-                    return True
-            for i in len(inputvar_list):
-                r = self.appear_then_click(inputvar_list[i])
-                if r: succ_flags[i] = True
+                done.set()
+
+        for i in range(len(inputvar_list)):
+            watcher.watch(inputvar_list[i], click(i), repeat=True)
+        watcher.watch(verify_img, verify, condition=WATCH_APPEAR if verify_mode else WATCH_DISAPPEAR, repeat=True)
+        watcher.start()
+        try:
+            while not done.wait(0.1):
+                if stop_func():
+                    return False
+            return True
+        finally:
+            watcher.stop()
 
     def appear_then_press(self, imgicon: ImgIcon, key_name, is_gray=False):
         """appear then press
@@ -348,9 +1042,7 @@ class InteractionBGD:
         """
         upper_func_name = inspect.getframeinfo(inspect.currentframe().f_back)[2]
 
-        cap = self.capture(posi=imgicon.cap_posi, jpgmode=imgicon.jpgmode)
-
-        matching_rate = self.similar_img(imgicon.image, cap, is_gray=is_gray)
+        matching_rate = self._similar_icon(imgicon, is_gray=is_gray)
 
         if imgicon.is_print_log(matching_rate >= imgicon.threshold):
             logger.debug(
@@ -379,32 +1071,52 @@ class InteractionBGD:
         return cv2.multiply(cv2.add(maximum, cv2.subtract(maximum, minimum)), 255.0 / threshold)
 
     # @staticmethod
-    def png2jpg(self, png, bgcolor='black', channel='bg', alpha_num=50):
-        """将截图的4通道png转换为3通道jpg
+    def _png2jpg_buffers(self, shape):
+        """当前线程中按图片大小复用的透明通道与掩码缓冲区。"""
+        buffers = getattr(self.png2jpg_local, 'buffers', None)
+        if buffers is None:
+            buffers = self.png2jpg_local.buffers = {}
+        ret = buffers.get(shape)
+        if ret is None:
+            ret = (np.empty(shape, dtype='uint8'), np.empty(shape, dtype='uint8'), np.empty(shape + (3,), dtype='uint8'))
+            buffers[shape] = ret
+        return ret
+
+    def png2jpg(self, png, bgcolor='black', channel='bg', alpha_num=50, dst=None):
+        """将截图的4通道png转换为3通道jpg。不修改png。
 
         Args:
             png (Mat/ndarray): 4通道图片
             bgcolor (str, optional): 背景的颜色. Defaults to 'black'.
             channel (str, optional): 提取背景或UI. Defaults to 'bg'.
             alpha_num (int, optional): 透明通道的大小. Defaults to 50.
+            dst (ndarray, optional): 输出缓冲区，形状为(h, w, 3)的uint8数组，为None时新建. Defaults to None.
 
         Returns:
             Mat/ndarray: 3通道图片
         """
-        if bgcolor == 'black':
-            bgcol = 0
-        else:
-            bgcol = 255
-
-        jpg = png[:, :, :3]
+        h, w = png.shape[:2]
+        if dst is None:
+            dst = np.empty((h, w, 3), dtype='uint8')
+        elif dst.shape != (h, w, 3) or dst.dtype != np.uint8:
+            raise ValueError(f"dst shape {dst.shape} {dst.dtype} != {(h, w, 3)} uint8")
+        alpha, mask, mask3 = self._png2jpg_buffers((h, w))
+
+        # 保留的像素掩码为255，其余为0
+        cv2.extractChannel(png, 3, dst=alpha)
         if channel == 'bg':
-            over_item_list = png[:, :, 3] > alpha_num
+            cv2.threshold(alpha, alpha_num, 255, cv2.THRESH_BINARY_INV, dst=mask)
         else:
-            over_item_list = png[:, :, 3] < alpha_num
-        jpg[:, :, 0][over_item_list] = bgcol
-        jpg[:, :, 1][over_item_list] = bgcol
-        jpg[:, :, 2][over_item_list] = bgcol
-        return jpg
+            cv2.threshold(alpha, alpha_num - 1, 255, cv2.THRESH_BINARY, dst=mask)
+        cv2.cvtColor(png, cv2.COLOR_BGRA2BGR, dst=dst)
+        if bgcolor == 'black':
+            cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR, dst=mask3)
+            cv2.bitwise_and(dst, mask3, dst=dst)
+        else:
+            cv2.bitwise_not(mask, dst=mask)
+            cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR, dst=mask3)
+            cv2.bitwise_or(dst, mask3, dst=dst)
+        return dst
 
     # @staticmethod
     def color_sd(self, x_col, target_col):  # standard deviation
@@ -554,7 +1266,7 @@ class InteractionBGD:
 
         self.operation_lock.acquire()
         if True:
-            logger.demo("按下按键: ") + str(key)
+            logger.demo("按下按键: " + str(key))
         if key == 'w':
             static_lib.W_KEYDOWN = True
         self.itt_exec.key_down(key)
@@ -575,7 +1287,7 @@ class InteractionBGD:
 
         self.operation_lock.acquire()
         if True:
-            logger.demo("松开按键: ") + str(key)
+            logger.demo("松开按键: " + str(key))
         if key == 'w':
             static_lib.W_KEYDOWN = False
         self.itt_exec.key_up(key)
@@ -595,7 +1307,7 @@ class InteractionBGD:
 
         self.operation_lock.acquire()
         if True:
-            logger.demo("点击按键: ") + str(key)
+            logger.demo("点击按键: " + str(key))
         self.itt_exec.key_press(key)
         self.key_status[key] = False
         self.operation_lock.release()
@@ -612,7 +1324,7 @@ class InteractionBGD:
 
         self.operation_lock.acquire()
         if True:
-            logger.demo("移动鼠标到坐标: ") + f"{round(x, 0)},{round(y, 0)}"
+            logger.demo("移动鼠标到坐标: " + f"{round(x, 0)},{round(y, 0)}")
         self.itt_exec.move_to(int(x), int(y), relative=relative)
         self.operation_lock.release()
 
@@ -625,7 +1337,7 @@ class InteractionBGD:
 
         self.operation_lock.acquire()
         if True:
-            logger.demo("移动鼠标到坐标: ") + f"{round(position[0], 0)},{round(position[1], 0)} 并点击"
+            logger.demo("移动鼠标到坐标: " + f"{round(position[0], 0)},{round(position[1], 0)} 并点击")
         x = int(position[0])
         y = int(position[1])
 
@@ -679,10 +1391,34 @@ def itt_test(itt: InteractionBGD):
     pass
 
 
-itt = InteractionBGD()
+# 全局InteractionBGD，第一次访问interaction_core.itt时创建，导入本模块不会创建截图后端。
+# 截图后端由环境变量GIA_CAPTURE_BACKEND选择(默认windows)，回放后端的source由GIA_CAPTURE_SOURCE指定
+_itt = None
+_itt_lock = threading.Lock()
+
+
+def get_itt() -> InteractionBGD:
+    """全局InteractionBGD，第一次调用时按环境变量创建。
+    """
+    global _itt
+    with _itt_lock:
+        if _itt is None:
+            backend = os.environ.get('GIA_CAPTURE_BACKEND', 'windows')
+            kwargs = {}
+            if os.environ.get('GIA_CAPTURE_SOURCE'):
+                kwargs['source'] = os.environ['GIA_CAPTURE_SOURCE']
+            _itt = InteractionBGD(backend, **kwargs)
+        return _itt
+
+
+def __getattr__(name):
+    if name == 'itt':
+        return get_itt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     ib = InteractionBGD()
+    itt = get_itt()
     rootpath = "D:\\Program Data\\vscode\\GIA\\genshin_impact_assistant\\dist\\imgs"
     # ib.similar_img_pixel(cv2.imread(rootpath+"\\yunjin_q.png"),cv2.imread(rootpath+"\\zhongli_q.png"))
     from source.manager import asset, img_manager
@@ -1,6 +1,5 @@
 import string
 import ctypes
-VkKeyScanA = ctypes.windll.user32.VkKeyScanA
 
 class InteractionTemplate():
     def __init__(self):
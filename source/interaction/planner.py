@@ -0,0 +1,167 @@
+import collections
+import threading
+import time
+
+from source.util import logger
+
+PLAN_ANY = 'any'
+PLAN_ALL = 'all'
+
+
+class DetectorPlanner():
+    """
+    按代价排列多个imgicon的检查顺序。
+    记录每个icon在各界面(page)下的平均检查耗时与命中率，一组检查按期望收益排序并在结果确定后停止:
+    any_of按 命中率/耗时 从大到小检查，找到一个即返回；all_of按 未命中率/耗时 从大到小检查，有一个不存在即返回。
+    每次查询的检查顺序、结果和被跳过的icon记录在traces中。
+    """
+
+    def __init__(self, itt, prior_hit_rate=0.5, prior_cost=0.005, max_traces=100):
+        """
+        Args:
+            itt (InteractionBGD): 执行检查的InteractionBGD
+            prior_hit_rate (float, optional): 没有记录时的命中率. Defaults to 0.5.
+            prior_cost (float, optional): 没有记录时的耗时，单位为秒. Defaults to 0.005.
+            max_traces (int, optional): 保留的查询记录数量. Defaults to 100.
+        """
+        self.itt = itt
+        self.prior_hit_rate = prior_hit_rate
+        self.prior_cost = prior_cost
+        self.lock = threading.Lock()
+        # (icon名称, page) -> [检查次数, 命中次数, 计入耗时的次数, 总耗时]
+        self.stats = {}
+        # 当前识别到的界面，None为未知。命中win_page不为'all'的icon时更新
+        self.current_page = None
+        self.traces = collections.deque(maxlen=max_traces)
+
+    def set_page(self, page):
+        self.current_page = page
+
+    def estimate(self, imgicon, page=None) -> tuple:
+        """icon在page下的命中率和耗时估计。命中率按(命中+先验)/(次数+1)平滑。
+
+        Returns:
+            (float, float): 命中率, 耗时(秒)
+        """
+        with self.lock:
+            stats = self.stats.get((imgicon.name, page))
+        if stats is None:
+            return self.prior_hit_rate, self.prior_cost
+        checks, hits, timed, total = stats
+        hit_rate = (hits + self.prior_hit_rate) / (checks + 1)
+        cost = total / timed if timed else self.prior_cost
+        return hit_rate, max(cost, 1e-6)
+
+    def _record(self, imgicon, page, hit, cost):
+        with self.lock:
+            stats = self.stats.setdefault((imgicon.name, page), [0, 0, 0, 0.])
+            stats[0] += 1
+            stats[1] += hit
+            if cost is not None:
+                stats[2] += 1
+                stats[3] += cost
+
+    def check(self, imgicon, is_gray=False, page=None) -> tuple:
+        """检查一个icon并记录结果。
+        复用了同一帧内的匹配结果，或搜索区域未变化复用了上次的结果时，没有真正匹配，耗时不计入平均值。
+
+        Returns:
+            (bool, float): 是否存在, 耗时(秒)
+        """
+        before = self.itt.match_counters()
+        t = time.perf_counter()
+        hit = self.itt.get_img_existence(imgicon, is_gray=is_gray, is_log=False)
+        cost = time.perf_counter() - t
+        after = self.itt.match_counters()
+        reused = after['memo_hits'] != before['memo_hits'] or after['reuse_times'] != before['reuse_times']
+        self._record(imgicon, page, hit, None if reused else cost)
+        if hit and imgicon.win_page != 'all':
+            self.current_page = imgicon.win_page
+        return hit, cost
+
+    def plan(self, icons, mode=PLAN_ANY, page=None) -> list:
+        """按期望收益排列检查顺序。
+
+        Returns:
+            list[(ImgIcon, float, float)]: icon, 命中率, 耗时
+        """
+        ret = []
+        for imgicon in icons:
+            hit_rate, cost = self.estimate(imgicon, page)
+            ret.append((imgicon, hit_rate, cost))
+        if mode == PLAN_ANY:
+            ret.sort(key=lambda x: x[1] / x[2], reverse=True)
+        else:
+            ret.sort(key=lambda x: (1 - x[1]) / x[2], reverse=True)
+        return ret
+
+    def _run(self, icons, mode, is_gray):
+        page = self.current_page
+        trace = {'mode': mode, 'page': page, 'result': None, 'checked': [], 'skipped': [], 'time': 0.}
+        t = time.perf_counter()
+        order = self.plan(icons, mode, page)
+        result = None if mode == PLAN_ANY else True
+        for i, (imgicon, hit_rate, cost) in enumerate(order):
+            hit, used = self.check(imgicon, is_gray, page)
+            trace['checked'].append({'name': imgicon.name, 'hit_rate': hit_rate, 'cost': cost,
+                                     'hit': hit, 'time': used})
+            if mode == PLAN_ANY and hit:
+                result = imgicon
+            elif mode == PLAN_ALL and not hit:
+                result = False
+            else:
+                continue
+            trace['skipped'] = [item[0].name for item in order[i + 1:]]
+            break
+        trace['time'] = time.perf_counter() - t
+        trace['result'] = result.name if mode == PLAN_ANY and result is not None else result
+        self.traces.append(trace)
+        logger.trace(f"planner {mode}: {trace['result']} checked {len(trace['checked'])} "
+                     f"skipped {len(trace['skipped'])} in {round(trace['time'] * 1000, 1)} ms")
+        return result
+
+    def any_of(self, icons, is_gray=False):
+        """icons中是否有存在的icon。
+
+        Args:
+            icons (list[ImgIcon]): imgicon列表
+            is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
+
+        Returns:
+            ImgIcon/None: 找到的第一个icon，都不存在时为None
+        """
+        return self._run(icons, PLAN_ANY, is_gray)
+
+    def all_of(self, icons, is_gray=False) -> bool:
+        """icons是否全部存在，有一个不存在时不再检查其余的icon。
+
+        Args:
+            icons (list[ImgIcon]): imgicon列表
+            is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
+
+        Returns:
+            bool: 是否全部存在
+        """
+        return self._run(icons, PLAN_ALL, is_gray)
+
+    @property
+    def last_trace(self) -> dict:
+        """最近一次查询的记录: mode, page, result, checked(每项name, hit_rate, cost, hit, time), skipped, time。
+        """
+        return self.traces[-1] if self.traces else None
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: {(icon名称, page): {checks, hit_rate, cost_ms}}
+        """
+        with self.lock:
+            items = list(self.stats.items())
+        ret = {}
+        for (name, page), (checks, hits, timed, total) in items:
+            ret[(name, page)] = {
+                'checks': checks,
+                'hit_rate': hits / checks if checks else None,
+                'cost_ms': total / timed * 1000 if timed else None,
+            }
+        return ret
@@ -0,0 +1,226 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from source.common.timer_module import Histogram
+from source.util import logger
+
+WATCH_APPEAR = 'appear'
+WATCH_DISAPPEAR = 'disappear'
+WATCH_STABLE = 'stable'
+
+# 触发时传给回调的事件。position为在搜索区域中的坐标，latency为截图到回调开始的时间(秒)
+WatchEvent = collections.namedtuple('WatchEvent', ['item', 'condition', 'frame_id', 'score', 'position', 'latency'])
+
+
+class WatchItem():
+    """
+    Watcher中的一个监视项，记录条件与连续满足条件的帧数。
+    """
+
+    def __init__(self, imgicon, callback, condition=WATCH_APPEAR, frames=1, repeat=False, is_gray=False):
+        """
+        Args:
+            imgicon (ImgIcon): 监视的imgicon
+            callback (callable): 条件满足时调用，参数为WatchEvent
+            condition (str, optional): WATCH_APPEAR, WATCH_DISAPPEAR或WATCH_STABLE. Defaults to WATCH_APPEAR.
+            frames (int, optional): 条件需连续满足的帧数。WATCH_STABLE为位置不变的帧数. Defaults to 1.
+            repeat (bool, optional): 条件保持满足时每帧都触发，否则条件由不满足变为满足时触发一次. Defaults to False.
+            is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
+        """
+        if condition not in (WATCH_APPEAR, WATCH_DISAPPEAR, WATCH_STABLE):
+            raise ValueError(f"unknown watch condition: {condition}")
+        self.imgicon = imgicon
+        self.callback = callback
+        self.condition = condition
+        self.frames = max(int(frames), 1)
+        self.repeat = repeat
+        self.is_gray = is_gray
+        self.count = 0
+        self.last_position = None
+        self.fired = False
+        self.fire_times = 0
+
+    def reset(self):
+        self.count = 0
+        self.last_position = None
+        self.fired = False
+
+    def update(self, found: bool, position) -> bool:
+        """用一帧的匹配结果更新状态。
+
+        Returns:
+            bool: 本帧是否触发
+        """
+        if self.condition == WATCH_APPEAR:
+            hold = found
+        elif self.condition == WATCH_DISAPPEAR:
+            hold = not found
+        else:
+            hold = found and (self.last_position is None or self.last_position == position)
+            self.last_position = position if found else None
+        if not hold:
+            # WATCH_STABLE中位置变化时，本帧作为新位置的第一帧
+            self.count = 1 if self.condition == WATCH_STABLE and found else 0
+            self.fired = False
+            return False
+        self.count += 1
+        if self.count < self.frames:
+            return False
+        if self.fired and not self.repeat:
+            return False
+        self.fired = True
+        return True
+
+
+class Watcher():
+    """
+    多个imgicon的事件监视，代替sleep后逐个截图匹配的轮询循环。
+    每出现一帧新截图，用match_many在这一帧中匹配全部监视项，条件满足时在回调线程中按顺序调用回调。
+    回调中对同一帧的get_img_existence/appear_then_click等查询直接使用本帧的匹配结果。
+    """
+
+    def __init__(self, itt, timeout=1.0, interval=None):
+        """
+        Args:
+            itt (InteractionBGD): 截图与匹配使用的InteractionBGD
+            timeout (float, optional): 等待新帧的最长时间，超时后重新检查是否停止. Defaults to 1.0.
+            interval (float, optional): 两次匹配的最短间隔，单位为秒。None时使用截图的1/max_fps. Defaults to None.
+        """
+        self.itt = itt
+        self.timeout = timeout
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.items = []
+        self.last_frame_id = -1
+        self.frames_evaluated = 0
+        # 截图到回调开始的时间
+        self.latency = Histogram()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.callback_executor = None
+        self._started_producer = False
+
+    def watch(self, imgicon, callback, condition=WATCH_APPEAR, frames=1, repeat=False, is_gray=False) -> WatchItem:
+        """添加监视项，参数同WatchItem。
+
+        Returns:
+            WatchItem: 监视项，用于unwatch
+        """
+        item = WatchItem(imgicon, callback, condition=condition, frames=frames, repeat=repeat, is_gray=is_gray)
+        with self.lock:
+            self.items.append(item)
+        return item
+
+    def unwatch(self, item: WatchItem):
+        with self.lock:
+            if item in self.items:
+                self.items.remove(item)
+
+    def evaluate(self, frame) -> list:
+        """在一帧中匹配全部监视项并更新状态，不调用回调。
+
+        Args:
+            frame (Frame): 截图帧
+
+        Returns:
+            list[WatchEvent]: 本帧触发的事件
+        """
+        with self.lock:
+            items = list(self.items)
+        groups = {}
+        for item in items:
+            groups.setdefault(item.is_gray, []).append(item)
+        events = []
+        for is_gray, group in groups.items():
+            icons = [item.imgicon for item in group]
+            result = self.itt.match_many(icons, frame, is_gray=is_gray)
+            for item, r in zip(group, result):
+                position = (int(r['x']), int(r['y']))
+                # 回调中对本帧的查询不再重复匹配
+                self.itt._set_match_memo(frame.frame_id, (id(item.imgicon), is_gray), (float(r['score']), position))
+                if item.update(bool(r['found']), position):
+                    item.fire_times += 1
+                    events.append(WatchEvent(item, item.condition, frame.frame_id, float(r['score']), position, None))
+        self.frames_evaluated += 1
+        return events
+
+    def _dispatch(self, event: WatchEvent, timestamp):
+        latency = time.time() - timestamp
+        self.latency.record(latency)
+        try:
+            event.item.callback(event._replace(latency=latency))
+        except Exception as e:
+            logger.exception(e)
+
+    def _interval(self) -> float:
+        if self.interval is not None:
+            return self.interval
+        return 1 / self.itt.capture_obj.max_fps
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            frame = self.itt.capture_obj.next_after(self.last_frame_id, timeout=self.timeout)
+            if frame is None:
+                continue
+            # 匹配较慢或截图帧率较高时跳过中间的帧，直接匹配最新帧
+            latest = self.itt.capture_obj.frame_ring.latest()
+            if latest is not None and latest.frame_id > frame.frame_id:
+                frame = latest
+            t = time.time()
+            self.last_frame_id = frame.frame_id
+            for event in self.evaluate(frame):
+                self.callback_executor.submit(self._dispatch, event, frame.timestamp)
+            # 匹配频率不超过截图帧率或interval
+            dt = self._interval() - (time.time() - t)
+            if dt > 0:
+                self.stop_event.wait(dt)
+
+    def start(self):
+        """启动监视线程。后台截图线程没有运行时一并启动，stop时停止。
+        """
+        if self.is_running():
+            return
+        if not self.itt.capture_obj.is_producer_running():
+            self.itt.capture_obj.start_producer()
+            self._started_producer = True
+        if self.callback_executor is None:
+            self.callback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='WatcherCallback')
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, daemon=True, name='Watcher')
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """停止监视线程。
+
+        Args:
+            wait (bool, optional): 是否等待已触发的回调执行完. Defaults to True.
+        """
+        if self.thread is not None:
+            self.stop_event.set()
+            if self.thread is not threading.current_thread():
+                self.thread.join()
+            self.thread = None
+        if self.callback_executor is not None:
+            self.callback_executor.shutdown(wait=wait)
+            self.callback_executor = None
+        if self._started_producer:
+            self.itt.capture_obj.stop_producer()
+            self._started_producer = False
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: frames_evaluated, fire_times([(imgicon名称, 条件, 触发次数), ...]), latency(Histogram.snapshot)
+        """
+        with self.lock:
+            items = list(self.items)
+        return {
+            'frames_evaluated': self.frames_evaluated,
+            'fire_times': [(item.imgicon.name, item.condition, item.fire_times) for item in items],
+            'latency': self.latency.snapshot(),
+        }
@@ -12,11 +12,11 @@ def get_cap_posi(path, black_offset):
     return bbg_posi
 
 class Button(ImgIcon):
-    def __init__(self, path=None, name=None, black_offset=15, is_bbg = True , threshold=0.9,offset = 0, win_page = "all", win_text = None, print_log = LOG_NONE, cap_posi=None, click_offset=None):
+    def __init__(self, path=None, name=None, black_offset=15, is_bbg = True , threshold=0.9,offset = 0, win_page = "all", win_text = None, print_log = LOG_NONE, cap_posi=None, click_offset=None, use_mask=False):
         if name is None:
             name = get_name(traceback.extract_stack()[-2])
         super().__init__(path=path, name=name, jpgmode = 0, is_bbg = is_bbg,
-                         threshold=threshold, win_page=win_page, win_text=win_text, print_log=print_log, cap_posi=cap_posi, offset = offset)
+                         threshold=threshold, win_page=win_page, win_text=win_text, print_log=print_log, cap_posi=cap_posi, offset = offset, use_mask=use_mask)
         if click_offset is None:
             self.click_offset=np.array([0,0])
         else:
@@ -1,3 +1,6 @@
+import math
+import threading
+
 import cv2
 import numpy as np
 from source.manager.util import *
@@ -23,6 +26,285 @@ def qshow(img1):
     cv2.waitKey(0)
 
 
+# 黑色背景图片中亮度不超过该值的像素不参与掩码匹配，与get_bbox的black_offset一致
+MASK_BLACK_OFFSET = 15
+
+
+def load_mask(path, bbg_posi=None, black_offset=MASK_BLACK_OFFSET):
+    """从图片生成匹配掩码。有透明通道时使用透明通道，否则去掉黑色背景。
+
+    Args:
+        path (str): 图片路径
+        bbg_posi (list, optional): 裁剪区域，与ImgIcon.image一致. Defaults to None.
+        black_offset (int, optional): 黑色背景的亮度上限. Defaults to MASK_BLACK_OFFSET.
+
+    Returns:
+        numpy.ndarray/None: uint8掩码，255为参与匹配。全部参与匹配时返回None
+    """
+    raw = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if len(raw.shape) == 3 and raw.shape[2] == 4:
+        mask = raw[:, :, 3] > 0
+    elif len(raw.shape) == 3:
+        mask = np.max(raw, axis=2) > black_offset
+    else:
+        mask = raw > black_offset
+    if bbg_posi is not None:
+        mask = crop(mask, bbg_posi)
+    if mask.all():
+        return None
+    return np.ascontiguousarray(mask, dtype='uint8') * 255
+
+
+# 预筛选: 像素探针的数量、单通道允许的差值、允许不一致的探针比例
+PROBE_NUM = 16
+PROBE_TOLERANCE = 48
+PROBE_MAX_MISS = 0.5
+# 搜索区域中模板可能位置的数量不超过该值时才用探针逐个位置检查
+PROBE_MAX_POSITIONS = 4096
+# 颜色直方图每通道的分桶数(灰度图为HIST_BINS*4)，以及模板像素在区域中找到相近颜色的最低比例
+HIST_BINS = 8
+HIST_MIN_COVERAGE = 0.8
+
+
+def color_hist(img, mask=None):
+    """粗分桶颜色直方图，BGR为HIST_BINS**3桶，灰度为HIST_BINS*4桶。
+
+    Returns:
+        numpy.ndarray: float32像素计数
+    """
+    if len(img.shape) == 2:
+        return cv2.calcHist([img], [0], mask, [HIST_BINS * 4], [0, 256])
+    return cv2.calcHist([img], [0, 1, 2], mask, [HIST_BINS] * 3, [0, 256] * 3)
+
+
+def spread_hist(hist):
+    """每个桶加上各维相邻桶的计数，容许光照等造成的跨桶偏移。
+    """
+    ret = hist.reshape(hist.shape[:3] if hist.ndim == 3 else (-1,))
+    for axis in range(ret.ndim):
+        padded = np.pad(ret, [(1, 1) if i == axis else (0, 0) for i in range(ret.ndim)])
+        n = ret.shape[axis]
+        ret = (np.take(padded, range(0, n), axis=axis) + np.take(padded, range(1, n + 1), axis=axis)
+               + np.take(padded, range(2, n + 2), axis=axis))
+    return ret.reshape(hist.shape)
+
+
+class CompiledTemplate():
+    """
+    模板的预处理结果: BGR与灰度图、平方和、均值，以及按需生成的缩小图。
+    匹配时直接使用，不在每次匹配中重复转换模板。
+    有掩码时，模板中掩码外的像素置0，平方和与均值只统计掩码内的像素。
+    """
+
+    def __init__(self, image, mask=None):
+        """
+        Args:
+            image (numpy.ndarray): BGR模板图片
+            mask (numpy.ndarray, optional): uint8掩码，大小与image相同. Defaults to None.
+        """
+        self.mask = None
+        if mask is not None:
+            self.mask = np.ascontiguousarray(mask)
+            self.mask.flags.writeable = False
+            image = cv2.bitwise_and(image, image, mask=self.mask)
+        self.bgr = np.ascontiguousarray(image)
+        self.bgr.flags.writeable = False
+        self.gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        self.gray.flags.writeable = False
+        self.shape = self.bgr.shape
+        # sum(T^2)，TM_CCORR_NORMED的模板部分
+        self.norm_bgr = float(np.square(self.bgr, dtype='float64').sum())
+        self.norm_gray = float(np.square(self.gray, dtype='float64').sum())
+        self.mean_bgr = cv2.mean(self.bgr, mask=self.mask)[:3]
+        self.mean_gray = cv2.mean(self.gray, mask=self.mask)[0]
+        self._pyramid = {}
+        # score_at的float32模板与按线程复用的缓冲区
+        self.bgr_f32 = self.bgr.astype('float32').ravel()
+        self.gray_f32 = self.gray.astype('float32').ravel()
+        self._local = threading.local()
+        self._init_prefilter()
+
+    def score_at(self, region, is_gray=False, exact=True) -> float:
+        """region与模板大小相同时，直接计算这一个位置的TM_CCORR_NORMED，不调用matchTemplate。
+
+        Args:
+            region (numpy.ndarray): 与模板大小、通道数相同的图片
+            is_gray (bool, optional): 是否为灰度匹配. Defaults to False.
+            exact (bool, optional): 先检查region是否与模板完全相同，相同时直接返回1. Defaults to True.
+
+        Returns:
+            float: 匹配度
+        """
+        tpl = self.image(is_gray)
+        norm = self.norm(is_gray)
+        if norm <= 0:
+            return 0.
+        if exact and cv2.norm(region, tpl, cv2.NORM_INF, mask=self.mask) == 0:
+            return 1.
+        buf = getattr(self._local, 'gray' if is_gray else 'bgr', None)
+        if buf is None:
+            buf = np.empty(tpl.shape, dtype='float32')
+            setattr(self._local, 'gray' if is_gray else 'bgr', buf)
+        np.copyto(buf, region, casting='unsafe')
+        if self.mask is not None:
+            # 掩码外的像素不参与窗口能量
+            buf[self.mask == 0] = 0
+        flat = buf.ravel()
+        energy = float(np.dot(flat, flat))
+        if energy <= 0:
+            return 0.
+        dot = float(np.dot(flat, self.gray_f32 if is_gray else self.bgr_f32))
+        return min(dot / math.sqrt(energy * norm), 1.)
+
+    def match_small(self, region, is_gray=False) -> np.ndarray:
+        """region只比模板大出几个像素时的TM_CCORR_NORMED。
+        结果写入按线程、按结果大小复用的缓冲区，固定位置的区域每次匹配不再分配新的结果数组。
+
+        Args:
+            region (numpy.ndarray): 不小于模板、通道数相同的图片
+            is_gray (bool, optional): 是否为灰度匹配. Defaults to False.
+
+        Returns:
+            numpy.ndarray: 匹配结果，同一线程下一次相同大小的调用会覆盖它
+        """
+        tpl = self.image(is_gray)
+        shape = (region.shape[0] - tpl.shape[0] + 1, region.shape[1] - tpl.shape[1] + 1)
+        bufs = getattr(self._local, 'results', None)
+        if bufs is None:
+            bufs = self._local.results = {}
+        buf = bufs.get((is_gray, shape))
+        if buf is None:
+            buf = bufs[(is_gray, shape)] = np.empty(shape, dtype='float32')
+        res = cv2.matchTemplate(region, tpl, cv2.TM_CCORR_NORMED, result=buf, mask=self.mask)
+        if self.mask is not None:
+            # 全黑窗口的0/0置为0
+            np.nan_to_num(res, copy=False, nan=0, posinf=0, neginf=0)
+        return res
+
+    def _init_prefilter(self):
+        """选取探针像素并计算颜色直方图，供prefilter使用。
+        探针取模板分为4x4格后每格梯度最大的像素，颜色变化处最能区分不同图像。
+        """
+        h, w = self.gray.shape
+        grad = cv2.magnitude(cv2.Sobel(self.gray, cv2.CV_32F, 1, 0), cv2.Sobel(self.gray, cv2.CV_32F, 0, 1))
+        if self.mask is not None:
+            grad[self.mask == 0] = -1
+        side = int(math.sqrt(PROBE_NUM))
+        ys, xs = [], []
+        for i in range(side):
+            for j in range(side):
+                y0, y1 = h * i // side, h * (i + 1) // side
+                x0, x1 = w * j // side, w * (j + 1) // side
+                if y1 <= y0 or x1 <= x0:
+                    continue
+                cell = grad[y0:y1, x0:x1]
+                k = int(np.argmax(cell))
+                if cell.flat[k] < 0:
+                    continue
+                ys.append(y0 + k // cell.shape[1])
+                xs.append(x0 + k % cell.shape[1])
+        self.probe_y = np.array(ys, dtype='intp')
+        self.probe_x = np.array(xs, dtype='intp')
+        self.probe_bgr = self.bgr[self.probe_y, self.probe_x].astype('int16')
+        self.probe_gray = self.gray[self.probe_y, self.probe_x].astype('int16')
+        self.hist_bgr = color_hist(self.bgr, self.mask)
+        self.hist_gray = color_hist(self.gray, self.mask)
+        self.hist_total = float(self.hist_gray.sum())
+
+    def probe_check(self, region, is_gray=False) -> bool:
+        """在region中模板的每个可能位置检查探针像素。
+        可能位置过多时不检查，返回True。
+
+        Returns:
+            bool: 是否有位置的探针足够一致
+        """
+        n = len(self.probe_y)
+        th, tw = self.shape[:2]
+        h, w = region.shape[:2]
+        ph, pw = h - th + 1, w - tw + 1
+        if n == 0 or ph <= 0 or pw <= 0 or ph * pw > PROBE_MAX_POSITIONS:
+            return True
+        values = self.probe_gray if is_gray else self.probe_bgr
+        hits = np.zeros((ph, pw), dtype='int16')
+        for k in range(n):
+            y, x = self.probe_y[k], self.probe_x[k]
+            window = region[y:y + ph, x:x + pw]
+            if is_gray:
+                diff = np.abs(window.astype('int16') - values[k])
+            else:
+                diff = np.abs(window[:, :, :3].astype('int16') - values[k]).max(axis=2)
+            hits += diff <= PROBE_TOLERANCE
+        return int(hits.max()) >= n * (1 - PROBE_MAX_MISS)
+
+    def hist_coverage(self, region_hist, is_gray=False) -> float:
+        """模板像素中，能在区域的相同或相邻颜色桶中找到对应像素的比例。
+
+        Args:
+            region_hist (numpy.ndarray): 区域的spread_hist(color_hist(region))
+
+        Returns:
+            float: 0~1
+        """
+        if self.hist_total == 0:
+            return 1.
+        hist = self.hist_gray if is_gray else self.hist_bgr
+        return float(np.minimum(hist, region_hist).sum()) / self.hist_total
+
+    def prefilter(self, region, is_gray=False, region_hist=None) -> bool:
+        """匹配前的快速筛选: 先检查探针像素，再比较颜色直方图。
+        返回False时认为region中没有匹配，跳过matchTemplate。
+        容差较宽，只排除颜色或轮廓明显不同的区域。
+
+        Args:
+            region (numpy.ndarray): 搜索区域，与匹配时相同
+            is_gray (bool, optional): 是否为灰度匹配. Defaults to False.
+            region_hist (numpy.ndarray, optional): 预先计算的spread_hist(color_hist(region)). Defaults to None.
+
+        Returns:
+            bool: 是否可能匹配
+        """
+        if not self.probe_check(region, is_gray):
+            return False
+        if region_hist is None:
+            region_hist = spread_hist(color_hist(region if is_gray or region.shape[2] == 3 else region[:, :, :3]))
+        return self.hist_coverage(region_hist, is_gray) >= HIST_MIN_COVERAGE
+
+    def image(self, is_gray=False):
+        return self.gray if is_gray else self.bgr
+
+    def norm(self, is_gray=False) -> float:
+        return self.norm_gray if is_gray else self.norm_bgr
+
+    def pyramid_mask(self, level: int):
+        """缩小为1/2**level的掩码，没有掩码时返回None。
+        """
+        if self.mask is None or level <= 0:
+            return self.mask
+        key = (level, 'mask')
+        ret = self._pyramid.get(key)
+        if ret is None:
+            h, w = self.mask.shape[:2]
+            ret = cv2.resize(self.mask, (max(w >> level, 1), max(h >> level, 1)), interpolation=cv2.INTER_NEAREST)
+            ret.flags.writeable = False
+            self._pyramid[key] = ret
+        return ret
+
+    def pyramid(self, level: int, is_gray=False):
+        """缩小为1/2**level的模板，首次请求时计算并缓存。
+        """
+        img = self.image(is_gray)
+        if level <= 0:
+            return img
+        key = (level, is_gray)
+        ret = self._pyramid.get(key)
+        if ret is None:
+            h, w = img.shape[:2]
+            ret = cv2.resize(img, (max(w >> level, 1), max(h >> level, 1)), interpolation=cv2.INTER_AREA)
+            ret.flags.writeable = False
+            self._pyramid[key] = ret
+        return ret
+
+
 class ImgIcon(AssetBase):
     def __init__(self,
                  path=None,
@@ -36,7 +318,8 @@ class ImgIcon(AssetBase):
                  win_page='all',
                  win_text=None,
                  offset=0,
-                 print_log=LOG_NONE):
+                 print_log=LOG_NONE,
+                 use_mask=False):
         """创建一个img对象，用于图片识别等。
 
         Args:
@@ -52,6 +335,7 @@ class ImgIcon(AssetBase):
             win_text (str, optional): 匹配时图片内应该包含的文字. Defaults to None.
             offset (int, optional): 截图范围偏移. Defaults to 0.
             print_log (int, optional): 打印日志模式. Defaults to LOG_NONE.
+            use_mask (bool, optional): 是否只用透明通道或黑色背景以外的像素匹配. Defaults to False.
         """
         if name is None:
             super().__init__(get_name(traceback.extract_stack()[-2]))
@@ -105,6 +389,19 @@ class ImgIcon(AssetBase):
             self.image = crop(self.raw_image, self.bbg_posi)
         else:
             self.image = self.raw_image.copy()
+        self.use_mask = use_mask
+        self.mask = None
+        if use_mask:
+            self.mask = load_mask(self.origin_path, self.bbg_posi if self.is_bbg else None)
+        self._compiled = None
+
+    @property
+    def compiled(self) -> CompiledTemplate:
+        """预处理后的模板，第一次使用时生成。
+        """
+        if self._compiled is None:
+            self._compiled = CompiledTemplate(self.image, self.mask)
+        return self._compiled
 
     def show_image(self):
         cv2.imshow('123', self.image)
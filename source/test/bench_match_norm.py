@@ -0,0 +1,35 @@
+"""多个模板共用同一区域时，cv2.matchTemplate与FFTMatcher共用窗口能量(spatial)的耗时。
+结果的一致性见test_match_norm。
+
+在项目根目录运行: python -m source.test.bench_match_norm
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+from source.interaction.fft_match import FFTMatcher
+
+if __name__ == '__main__':
+    img = cv2.resize(cv2.imread(os.path.join(os.path.dirname(__file__), 'source.png')), (1920, 1080))
+    rng = np.random.default_rng(0)
+    # 同一区域上的多组同样大小的模板(如一排按钮): cv2每次重新计算归一化，spatial每种大小只计算一次窗口能量
+    group = []
+    for (w, h) in [(48, 32)] * 6 + [(64, 64)] * 6:
+        x, y = int(rng.integers(0, 1920 - w)), int(rng.integers(0, 1080 - h))
+        group.append(img[y:y + h, x:x + w].copy())
+    for is_gray in [False, True]:
+        region = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if is_gray else img
+        tpls = [cv2.cvtColor(t, cv2.COLOR_BGR2GRAY) if is_gray else t for t in group]
+        t = time.perf_counter()
+        for template in tpls:
+            cv2.matchTemplate(region, template, cv2.TM_CCORR_NORMED)
+        cv2_t = time.perf_counter() - t
+        matcher = FFTMatcher()
+        t = time.perf_counter()
+        for template in tpls:
+            matcher.spatial(region, template, img_key=('region', is_gray))
+        shared_t = time.perf_counter() - t
+        print(f"gray={is_gray!s:5} {len(tpls)} templates: cv2 {round(cv2_t * 1000)} ms, "
+              f"shared norm {round(shared_t * 1000)} ms")
@@ -0,0 +1,67 @@
+"""png2jpg性能对比: 旧实现与单次遍历、复用缓冲区的新实现。
+
+在项目根目录运行: python -m source.test.bench_png2jpg
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+from source.interaction.interaction_core import InteractionBGD
+
+
+def png2jpg_old(png, bgcolor='black', channel='bg', alpha_num=50):
+    """旧实现，会修改png"""
+    if bgcolor == 'black':
+        bgcol = 0
+    else:
+        bgcol = 255
+
+    jpg = png[:, :, :3]
+    if channel == 'bg':
+        over_item_list = png[:, :, 3] > alpha_num
+    else:
+        over_item_list = png[:, :, 3] < alpha_num
+    jpg[:, :, 0][over_item_list] = bgcol
+    jpg[:, :, 1][over_item_list] = bgcol
+    jpg[:, :, 2][over_item_list] = bgcol
+    return jpg
+
+
+def make_frame():
+    path = os.path.join(os.path.dirname(__file__), 's20230802150611.jpg')
+    img = cv2.imread(path)
+    if img is None:
+        img = np.random.randint(0, 256, (1080, 1920, 3), dtype='uint8')
+    img = cv2.resize(img, (1920, 1080))
+    png = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    png[:, :, 3] = np.random.randint(0, 256, (1080, 1920), dtype='uint8')
+    return png
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        func()
+    return (time.perf_counter() - t) / times * 1000
+
+
+if __name__ == '__main__':
+    itt = InteractionBGD(capture_backend='replay', source=os.path.join(os.path.dirname(__file__), 's20230802150611.jpg'))
+    png = make_frame()
+    dst = np.empty((1080, 1920, 3), dtype='uint8')
+    times = 50
+    for bgcolor in ['black', 'white']:
+        for channel in ['bg', 'ui']:
+            expect = png2jpg_old(png.copy(), bgcolor=bgcolor, channel=channel)
+            src = png.copy()
+            assert np.array_equal(itt.png2jpg(src, bgcolor=bgcolor, channel=channel), expect)
+            assert np.array_equal(src, png)
+
+            old = bench(lambda: png2jpg_old(png.copy(), bgcolor=bgcolor, channel=channel), times)
+            copy = bench(lambda: png.copy(), times)
+            new = bench(lambda: itt.png2jpg(png, bgcolor=bgcolor, channel=channel), times)
+            new_dst = bench(lambda: itt.png2jpg(png, bgcolor=bgcolor, channel=channel, dst=dst), times)
+            print(f"{bgcolor:5} {channel:2} | old: {round(old - copy, 2)} ms | new: {round(new, 2)} ms"
+                  f" | new with dst: {round(new_dst, 2)} ms")
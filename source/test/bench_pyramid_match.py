@@ -0,0 +1,60 @@
+"""金字塔匹配与全分辨率匹配在1920x1080全屏搜索中的耗时和结果对比，
+以及同一帧多个模板共用Frame.pyramid的耗时与退回全分辨率匹配的比例。
+
+在项目根目录运行: python -m source.test.bench_pyramid_match
+"""
+import os
+import time
+
+import cv2
+from source.interaction.frame import Frame
+from source.interaction.interaction_core import InteractionBGD, IMG_POSI
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        ret = func()
+    return (time.perf_counter() - t) / times * 1000, ret
+
+
+if __name__ == '__main__':
+    path = os.path.join(os.path.dirname(__file__), 's20230802150611.jpg')
+    itt = InteractionBGD(capture_backend='replay', source=path)
+    img = cv2.resize(cv2.imread(os.path.join(os.path.dirname(__file__), 'source.png')), (1920, 1080))
+    times = 5
+    for (x, y, w, h) in [(300, 200, 48, 48), (1200, 600, 96, 64), (1500, 900, 160, 120)]:
+        template = img[y:y + h, x:x + w].copy()
+        print(f"template {w}x{h} at {(x, y)}")
+        for is_gray in [False, True]:
+            full_t, (full_rate, full_loc) = bench(
+                lambda: itt.similar_img(img, template, is_gray=is_gray, ret_mode=IMG_POSI, pyramid_level=0), times)
+            print(f"  gray={is_gray!s:5} level 0: {round(full_t, 1)} ms rate {round(full_rate, 4)} loc {full_loc}")
+            for level in [1, 2, 3]:
+                t, (rate, loc) = bench(
+                    lambda: itt.similar_img(img, template, is_gray=is_gray, ret_mode=IMG_POSI, pyramid_level=level),
+                    times)
+                print(f"  gray={is_gray!s:5} level {level}: {round(t, 1)} ms rate {round(rate, 4)} loc {loc}"
+                      f" | x{round(full_t / t, 1)}")
+
+    # 同一帧中的多个模板: 每次查询缩小整个区域 vs 共用帧缓存的金字塔(Frame.pyramid)
+    frame = Frame(1, cv2.cvtColor(img, cv2.COLOR_BGR2BGRA))
+    posi = [0, 0, 1920, 1080]
+    region = itt.frame_view(frame, posi, jpgmode=0)
+    templates = [img[y:y + 64, x:x + 64].copy() for (x, y) in [(300, 200), (700, 400), (1200, 600), (1500, 900)]]
+    full = [itt.similar_img(region, i, ret_mode=IMG_POSI, pyramid_level=0)[1] for i in templates]
+    for level in [2, 3]:
+        start = itt.match_counters()
+        per_query_t, per_query = bench(lambda: [itt.similar_img(region, i, ret_mode=IMG_POSI, pyramid_level=level)
+                                                for i in templates], times)
+        shared_t, shared = bench(lambda: [
+            itt.similar_img(region, i, ret_mode=IMG_POSI, pyramid_level=level,
+                            img_pyramid=lambda lv: itt.frame_pyramid(frame, lv, posi, jpgmode=0)) for i in templates],
+            times)
+        end = itt.match_counters()
+        fallback = end['pyramid_fallbacks'] - start['pyramid_fallbacks']
+        print(f"{len(templates)} templates level {level}: per query pyramid_down {round(per_query_t, 1)} ms, "
+              f"Frame.pyramid {round(shared_t, 1)} ms | x{round(per_query_t / shared_t, 1)}"
+              f" | same loc as level 0 (per query/Frame.pyramid): {sum(a[1] == b for a, b in zip(per_query, full))}"
+              f"/{sum(a[1] == b for a, b in zip(shared, full))} of {len(templates)}"
+              f" | fallback {fallback}/{end['pyramid_times'] - start['pyramid_times']}")
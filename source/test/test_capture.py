@@ -0,0 +1,141 @@
+"""截图后台线程与录制的测试，使用回放后端。
+
+在项目根目录运行: python -m unittest source.test.test_capture
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import cv2
+
+from source.interaction.capture import ReplayCapture
+from source.interaction.capture_rate import CaptureRateController
+from source.interaction.frame_recorder import FrameReader
+
+TEST_DIR = os.path.dirname(__file__)
+SOURCE = os.path.join(TEST_DIR, 's20230802150611.jpg')
+
+
+class ProducerPacingTest(unittest.TestCase):
+
+    def _grab_rate(self, capture, duration=1.0):
+        # 不断等待新帧，每次等待都会唤醒后台线程
+        capture.start_producer()
+        try:
+            time.sleep(0.1)
+            start, t = capture.capture_times, time.time()
+            while time.time() - t < duration:
+                capture.wait_for_new(timeout=0.5)
+                capture.next_after(capture.frame_id, timeout=0.5)
+            return (capture.capture_times - start) / (time.time() - t)
+        finally:
+            capture.stop_producer()
+
+    def test_wake_keeps_max_fps(self):
+        capture = ReplayCapture(SOURCE, fps=30)
+        self.assertLessEqual(self._grab_rate(capture), 30 * 1.1)
+
+    def test_wake_keeps_controller_max_fps(self):
+        capture = ReplayCapture(SOURCE, fps=30)
+        capture.set_rate_controller(CaptureRateController(min_fps=3, max_fps=20))
+        rate = self._grab_rate(capture)
+        self.assertLessEqual(rate, 20 * 1.1)
+        # 有使用者等待时应提前唤醒，而不是停在最低帧率
+        self.assertGreater(rate, 3 * 2)
+
+
+class SlowSignatureCapture(ReplayCapture):
+    """分块校验和耗时固定为0.02秒的回放后端。
+    """
+
+    def tile_signature(self, frame):
+        if frame.frame_id not in self.tile_history:
+            time.sleep(0.02)
+        return super().tile_signature(frame)
+
+
+class CaptureStatsTest(unittest.TestCase):
+
+    def test_grab_latency_includes_tile_signature(self):
+        capture = SlowSignatureCapture(SOURCE)
+        capture.set_rate_controller()
+        for _ in range(3):
+            capture._grab_frame()
+        grab_latency = capture.stats.grab_latency.snapshot()
+        self.assertEqual(grab_latency['count'], 3)
+        self.assertGreaterEqual(grab_latency['min'], 0.02)
+
+    def test_lock_waits_are_separate(self):
+        capture = ReplayCapture(SOURCE)
+        for _ in range(3):
+            capture._grab_frame()
+        for _ in range(2):
+            capture.capture()
+        snapshot = capture.stats.snapshot()
+        self.assertNotIn('lock_wait', snapshot)
+        # 每次截图等待grab_lock，每次读取当前帧等待capture_cache_lock
+        self.assertEqual(snapshot['grab_lock_wait']['count'], capture.capture_times)
+        self.assertEqual(snapshot['cache_lock_wait']['count'], 2)
+
+
+class TileSignatureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_moved_pixels_in_tile(self):
+        img = cv2.imread(SOURCE)
+        img[280:320, 280:320] = 0
+        moved = img.copy()
+        # 同一个40x40分块内的图标移动位置，分块内像素之和不变
+        img[290:300, 285:292] = 255
+        moved[290:300, 300:307] = 255
+        cv2.imwrite(os.path.join(self.dir, '0.png'), img)
+        cv2.imwrite(os.path.join(self.dir, '1.png'), moved)
+        capture = ReplayCapture(self.dir, loop=False)
+        first = capture._grab_frame()
+        capture.tile_signature(first)
+        second = capture._grab_frame()
+        self.assertTrue(capture.region_changed([280, 280, 320, 320], first.frame_id, second))
+        self.assertFalse(capture.region_changed([400, 400, 600, 600], first.frame_id, second))
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_shape_change_stops_recording(self):
+        img = cv2.imread(SOURCE)
+        frames = os.path.join(self.dir, 'frames')
+        os.makedirs(frames)
+        cv2.imwrite(os.path.join(frames, '0.png'), img)
+        cv2.imwrite(os.path.join(frames, '1.png'), img)
+        # 录制中窗口尺寸变化
+        cv2.imwrite(os.path.join(frames, '2.png'), cv2.resize(img, (640, 480)))
+        capture = ReplayCapture(frames, loop=False)
+        capture._grab_frame()
+        recorder = capture.start_recording(os.path.join(self.dir, 'record'))
+        capture._grab_frame()
+        frame = capture._grab_frame()
+        self.assertEqual(frame.shape[:2], (480, 640))
+        self.assertIsNone(capture.recorder)
+        self.assertTrue(recorder.closed)
+        self.assertEqual(recorder.drop_times, 1)
+        # 之后的截图不受影响
+        capture._grab_frame()
+        reader = FrameReader(os.path.join(self.dir, 'record'))
+        self.assertEqual(len(reader), 1)
+        self.assertEqual(reader[0].shape[:2], img.shape[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""CompiledTemplate固定位置匹配的测试。
+
+在项目根目录运行: python -m unittest source.test.test_compiled_template
+"""
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from source.manager.img_manager import CompiledTemplate
+
+TEST_DIR = os.path.dirname(__file__)
+SOURCE = os.path.join(TEST_DIR, 's20230802150611.jpg')
+
+
+class MatchSmallTest(unittest.TestCase):
+
+    def test_reuses_result_buffer(self):
+        img = cv2.imread(SOURCE)
+        mask = np.zeros((40, 60), dtype='uint8')
+        cv2.ellipse(mask, (30, 20), (30, 20), 0, 0, 360, 255, -1)
+        for compiled in [CompiledTemplate(img[200:240, 300:360]), CompiledTemplate(img[200:240, 300:360], mask)]:
+            for is_gray in [False, True]:
+                region = img[195:251, 292:368]
+                if is_gray:
+                    region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+                expect = cv2.matchTemplate(region, compiled.image(is_gray), cv2.TM_CCORR_NORMED, mask=compiled.mask)
+                first = compiled.match_small(region, is_gray)
+                np.testing.assert_allclose(first, expect, atol=1e-6)
+                self.assertEqual(cv2.minMaxLoc(first)[3], (8, 5))
+                # 同样大小的区域再次匹配时写入同一个缓冲区
+                self.assertIs(compiled.match_small(region, is_gray), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""FFTMatcher的缓存不会把原地复用的缓冲区当成同一张图片。
+
+在项目根目录运行: python -m unittest source.test.test_fft_match
+"""
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from source.interaction.fft_match import FFTMatcher
+from source.interaction.interaction_core import InteractionBGD
+from source.manager.img_manager import CompiledTemplate
+
+SOURCE = os.path.join(os.path.dirname(__file__), 's20230802150611.jpg')
+
+
+class FFTCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.itt = InteractionBGD(capture_backend='replay', source=SOURCE)
+        img = cv2.imread(SOURCE)
+        self.frame1 = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+        self.frame1[:, :, 3] = 0
+        self.template = img[200:260, 300:380].copy()
+        # 第二帧中模板所在位置的内容不同
+        self.frame2 = self.frame1.copy()
+        self.frame2[200:260, 300:380, :3] = 255 - self.frame2[200:260, 300:380, :3]
+
+    def test_reused_buffer(self):
+        expect = []
+        for frame in [self.frame1, self.frame2]:
+            expect.append(self.itt.similar_img(self.itt.png2jpg(frame), self.template))
+        self.assertLess(expect[1], 1 - 10 * FFTMatcher.MAX_ERROR)
+        buf = np.empty(self.frame1.shape[:2] + (3,), dtype='uint8')
+        for method in ['auto', 'fft', 'spatial']:
+            self.itt.match_method = method
+            self.itt.fft_matcher.clear()
+            ret = []
+            for frame in [self.frame1, self.frame2]:
+                self.itt.png2jpg(frame, dst=buf)
+                ret.append(self.itt.similar_img(buf, self.template))
+            np.testing.assert_allclose(ret, expect, atol=FFTMatcher.MAX_ERROR, err_msg=method)
+
+    def test_cache_keys(self):
+        matcher = FFTMatcher()
+        img = self.itt.png2jpg(self.frame1)
+        compiled = CompiledTemplate(self.template)
+        # 只读且自有内存的模板缓存频谱，可写的模板不缓存
+        for _ in range(2):
+            matcher.match(img, compiled.bgr, compiled.norm_bgr)
+        self.assertEqual(matcher.template_hits, 1)
+        writable = self.template.copy()
+        for _ in range(2):
+            matcher.match(img, writable)
+        self.assertEqual(matcher.template_hits, 1)
+        # 搜索区域只在给出img_key时缓存
+        hits = matcher.image_hits
+        matcher.match(img, compiled.bgr, img_key=('frame', 1))
+        matcher.match(img, compiled.bgr, img_key=('frame', 1))
+        self.assertEqual(matcher.image_hits, hits + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+"""无窗口环境下导入interaction_core并用回放后端运行识别流程。
+
+在项目根目录运行: python -m unittest source.test.test_interaction_headless
+"""
+import os
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from source.interaction import interaction_core
+from source.interaction.capture import ReplayCapture
+from source.interaction.interaction_core import InteractionBGD, IMG_POSI
+from source.manager.img_manager import ImgIcon
+from source.util import crop
+
+TEST_DIR = os.path.dirname(__file__)
+SOURCE = os.path.join(TEST_DIR, 's20230802150611.jpg')
+
+
+class HeadlessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.itt = InteractionBGD(capture_backend='replay', source=SOURCE)
+
+    def test_import_does_not_create_itt(self):
+        self.assertIsNone(interaction_core._itt)
+
+    def test_get_img_existence(self):
+        frame = cv2.imread(SOURCE)
+        path = os.path.join(TEST_DIR, '__headless_icon.png')
+        cv2.imwrite(path, frame[200:240, 300:360])
+        try:
+            icon = ImgIcon(path=path, name='headless_icon', cap_posi=[250, 150, 500, 400], jpgmode=0)
+        finally:
+            os.remove(path)
+        self.assertTrue(self.itt.get_img_existence(icon))
+        self.assertEqual(tuple(self.itt.get_img_position(icon)), (50, 50))
+        rate, loc = self.itt.similar_img(self.itt.capture(posi=icon.cap_posi, jpgmode=0), icon, ret_mode=IMG_POSI)
+        self.assertGreater(rate, 0.99)
+        # 回放后端的鼠标操作为空操作
+        self.assertTrue(self.itt.appear_then_click(icon))
+
+    def test_pyramid_from_frame(self):
+        frame = cv2.imread(SOURCE)
+        path = os.path.join(TEST_DIR, '__headless_icon.png')
+        cv2.imwrite(path, frame[200:264, 300:364])
+        try:
+            # 区域左上角不是4的倍数，从整帧的金字塔中裁剪时有偏移
+            icon = ImgIcon(path=path, name='headless_pyramid_icon', cap_posi=[250, 150, 602, 450], jpgmode=0)
+        finally:
+            os.remove(path)
+        self.itt.pyramid_level = 2
+        self.assertEqual(tuple(self.itt.get_img_position(icon)), (50, 50))
+        counters = self.itt.match_counters()
+        self.assertEqual(counters['pyramid_times'], 1)
+        self.assertEqual(counters['pyramid_fallbacks'], 0)
+
+    def test_pyramid_distractor(self):
+        img = cv2.resize(cv2.imread(os.path.join(TEST_DIR, 'source.png')), (1920, 1080))
+        template = img[200:264, 300:364].copy()
+        full = self.itt.similar_img(img, template, ret_mode=IMG_POSI, pyramid_level=0)
+        # 缩小后其他位置与模板相似，第一个粗匹配候选不是真正的位置
+        rate, loc = self.itt.similar_img(img, template, ret_mode=IMG_POSI, pyramid_level=3)
+        self.assertEqual(tuple(loc), tuple(full[1]))
+        self.assertGreater(rate, 0.999)
+
+        # 只有缩小后相同、细节不同的干扰区域: 细化后低于阈值，退回全分辨率匹配
+        checker = (np.indices((64, 64)).sum(axis=0) % 2 * 2 - 1)[:, :, None] * 60
+        distractor = np.clip(template.astype(int) + checker, 0, 255).astype('uint8')
+        img[200:264, 300:364] = 0
+        img[500:564, 1000:1064] = distractor
+        full = self.itt.similar_img(img, template, ret_mode=IMG_POSI, pyramid_level=0)
+        fallback = self.itt.pyramid_fallback_times
+        ret = self.itt.similar_img(img, template, ret_mode=IMG_POSI, pyramid_level=2, threshold=0.99)
+        self.assertEqual(self.itt.pyramid_fallback_times, fallback + 1)
+        self.assertEqual((ret[0], tuple(ret[1])), (full[0], tuple(full[1])))
+
+    def test_capture_region_uses_view_cache(self):
+        itt = InteractionBGD(capture_backend='replay', source=SOURCE, fps=1)
+        posi = [250, 150, 500, 400]
+        first = itt.capture(posi=posi, jpgmode=1)
+        hits = itt.view_cache.counters()['hits']
+        second = itt.capture(posi=posi, jpgmode=1)
+        # 同一帧同一区域的转换只计算一次，返回的仍是各自可写的数组
+        self.assertEqual(itt.view_cache.counters()['hits'], hits + 1)
+        self.assertTrue((first == second).all())
+        self.assertTrue(first.flags.writeable and second.flags.writeable)
+        self.assertFalse(np.shares_memory(first, second))
+        self.assertEqual(first.shape[:2], (250, 250))
+
+    def test_prefilter(self):
+        frame = cv2.imread(SOURCE)
+        path = os.path.join(TEST_DIR, '__headless_icon.png')
+        cv2.imwrite(path, frame[200:240, 300:360])
+        # 画面中没有的纯色方格，探针和颜色直方图都不一致
+        absent = np.zeros((40, 60, 3), dtype='uint8')
+        absent[:, :] = (255, 0, 255)
+        absent[10:30, 20:40] = (0, 255, 0)
+        absent_path = os.path.join(TEST_DIR, '__headless_absent.png')
+        cv2.imwrite(absent_path, absent)
+        try:
+            icon = ImgIcon(path=path, name='prefilter_icon', cap_posi=[250, 150, 500, 400], jpgmode=0)
+            absent_icon = ImgIcon(path=absent_path, name='prefilter_absent', cap_posi=[250, 150, 500, 400], jpgmode=0)
+        finally:
+            os.remove(path)
+            os.remove(absent_path)
+        self.itt.prefilter = True
+        for _ in range(2):
+            self.assertEqual(tuple(self.itt.get_img_position(icon)), (50, 50))
+            self.assertFalse(self.itt.get_img_existence(absent_icon))
+        report = self.itt.prefilter_report()
+        # 真正的匹配通过预筛选并执行匹配
+        self.assertEqual(report['prefilter_icon']['checks'], 2)
+        self.assertEqual(report['prefilter_icon']['rejects'], 0)
+        self.assertEqual(self.itt.prefilter_stats['prefilter_icon']['matches'], 2)
+        self.assertIsNotNone(report['prefilter_icon']['match_ms'])
+        # 明显不存在的模板在预筛选中排除，不执行匹配
+        self.assertEqual(report['prefilter_absent']['checks'], 2)
+        self.assertEqual(report['prefilter_absent']['rejects'], 2)
+        self.assertEqual(report['prefilter_absent']['reject_rate'], 1)
+        self.assertEqual(self.itt.prefilter_stats['prefilter_absent']['matches'], 0)
+        self.assertIsNone(report['prefilter_absent']['match_ms'])
+
+    def test_lazy_itt_from_env(self):
+        os.environ['GIA_CAPTURE_BACKEND'] = 'replay'
+        os.environ['GIA_CAPTURE_SOURCE'] = SOURCE
+        try:
+            itt = interaction_core.itt
+            self.assertIs(itt, interaction_core.get_itt())
+            self.assertEqual(itt.capture().shape[:2], cv2.imread(SOURCE).shape[:2])
+        finally:
+            interaction_core._itt = None
+            del os.environ['GIA_CAPTURE_BACKEND']
+            del os.environ['GIA_CAPTURE_SOURCE']
+
+
+class MatchManyTest(unittest.TestCase):
+    """match_many的每一行与在同一帧上逐个调用similar_img的结果一致。
+    """
+
+    def setUp(self):
+        self.itt = InteractionBGD(capture_backend='replay', source=SOURCE)
+        frame = cv2.imread(SOURCE)
+        jpg2 = self.itt._convert_jpgmode(cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA), 2)
+        # 带透明通道的模板，四角透明部分不参与匹配
+        alpha = np.zeros((48, 64), dtype='uint8')
+        cv2.ellipse(alpha, (32, 24), (30, 22), 0, 0, 360, 255, -1)
+        masked, masked_r1 = (cv2.cvtColor(img, cv2.COLOR_BGR2BGRA) for img in
+                             (frame[300:348, 600:664], frame[220:268, 320:384]))
+        masked[:, :, 3] = masked_r1[:, :, 3] = alpha
+        noise = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype='uint8')
+        r1, r2 = [250, 150, 500, 400], [500, 250, 900, 600]
+        # 两个搜索区域与两种jpgmode交替排列
+        specs = [
+            ('mm_a', frame[200:240, 300:360], r1, 0, False),
+            ('mm_b', frame[320:360, 650:720], r2, 0, False),
+            ('mm_masked', masked, r2, 0, True),
+            ('mm_noise', noise, r1, 0, False),
+            ('mm_jpg2', jpg2[260:300, 350:400], r1, 2, False),
+            ('mm_masked_r1', masked_r1, r1, 0, True),
+        ]
+        self.icons = []
+        for name, img, posi, jpgmode, use_mask in specs:
+            path = os.path.join(TEST_DIR, f'__{name}.png')
+            cv2.imwrite(path, img)
+            try:
+                self.icons.append(ImgIcon(path=path, name=name, cap_posi=posi, jpgmode=jpgmode, is_bbg=False,
+                                          use_mask=use_mask))
+            finally:
+                os.remove(path)
+        self.assertIsNotNone(self.icons[2].mask)
+
+    def _check(self, is_gray):
+        frame = self.itt.capture_frame()
+        ret = self.itt.match_many(self.icons, frame, is_gray=is_gray)
+        self.assertEqual(len(ret), len(self.icons))
+        for row, icon in zip(ret, self.icons):
+            cap = self.itt._convert_jpgmode(crop(frame.array, icon.cap_posi), icon.jpgmode)
+            rate, loc = self.itt.similar_img(cap, icon, is_gray=is_gray, ret_mode=IMG_POSI)
+            delta = 5e-3 if icon.mask is not None else 1e-4
+            self.assertAlmostEqual(float(row['score']), rate, delta=delta, msg=icon.name)
+            self.assertEqual((int(row['x']), int(row['y'])), tuple(loc), icon.name)
+            self.assertEqual(bool(row['found']), rate >= icon.threshold, icon.name)
+        return ret
+
+    def test_color(self):
+        ret = self._check(False)
+        self.assertEqual(ret['found'].tolist(), [True, True, True, False, True, True])
+
+    def test_gray(self):
+        self._check(True)
+
+    def test_single_icon(self):
+        # 只有一个icon时不使用线程池，结果与一起匹配时相同
+        frame = self.itt.capture_frame()
+        ret = self.itt.match_many(self.icons, frame)
+        for row, icon in zip(ret, self.icons):
+            self.assertEqual(tuple(self.itt.match_many([icon], frame)[0]), tuple(row), icon.name)
+
+
+class RoiReplayCapture(ReplayCapture):
+    """支持区域截图的回放后端，区域从当前回放帧中裁剪。
+    """
+    support_roi = True
+
+    def _get_capture_roi(self, posi):
+        return crop(self._frames[max(self.frame_index, 0)], posi)
+
+
+class RoiBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.itt = InteractionBGD(capture_backend='replay', source=SOURCE)
+        # 回放帧率20，整帧截图超过0.05秒后只截取区域
+        self.itt.capture_obj = RoiReplayCapture(SOURCE, fps=20)
+        self.itt.capture_frame()
+        frame = cv2.imread(SOURCE)
+        path = os.path.join(TEST_DIR, '__roi_icon.png')
+        cv2.imwrite(path, frame[200:240, 300:360])
+        try:
+            self.icon = ImgIcon(path=path, name='roi_icon', cap_posi=[250, 150, 500, 400], jpgmode=0)
+        finally:
+            os.remove(path)
+
+    def _next_interval(self):
+        time.sleep(0.06)
+        self.assertTrue(self.itt.capture_obj.will_capture_roi([self.icon.cap_posi]))
+
+    def test_memo_on_region_frame(self):
+        grabs = self.itt.capture_obj.capture_times
+        for _ in range(3):
+            self._next_interval()
+            self.assertTrue(self.itt.get_img_existence(self.icon))
+            self.assertEqual(tuple(self.itt.get_img_position(self.icon)), (50, 50))
+            self.assertTrue(self.itt.appear_then_click(self.icon))
+            self.assertEqual(self.itt.capture_obj.region_frame.grab_times, 1)
+        # 只截取区域，同一截图间隔内的查询使用本帧的结果
+        self.assertEqual(self.itt.capture_obj.capture_times, grabs)
+        counters = self.itt.match_counters()
+        self.assertEqual(counters['memo_misses'], 3)
+        self.assertGreaterEqual(counters['memo_hits'], 6)
+
+    def test_tracking_on_region_frame(self):
+        self.itt.tracking = True
+        for _ in range(3):
+            self._next_interval()
+            self.assertEqual(tuple(self.itt.get_img_position(self.icon)), (50, 50))
+        counters = self.itt.match_counters()
+        self.assertEqual(counters['track_hits'], 2)
+        self.assertEqual(counters['track_misses'], 0)
+
+    def test_capture_region_uses_view_cache(self):
+        self._next_interval()
+        posi = [250, 150, 500, 400]
+        first = self.itt.capture(posi=posi, jpgmode=1)
+        hits = self.itt.view_cache.counters()['hits']
+        second = self.itt.capture(posi=posi, jpgmode=1)
+        self.assertEqual(self.itt.view_cache.counters()['hits'], hits + 1)
+        self.assertEqual(self.itt.capture_obj.region_frame.grab_times, 1)
+        self.assertTrue((first == second).all())
+        self.assertFalse(np.shares_memory(first, second))
+
+
+if __name__ == '__main__':
+    unittest.main()
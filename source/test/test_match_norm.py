@@ -0,0 +1,85 @@
+"""FFTMatcher(共用积分图归一化的spatial、FFT、掩码FFT)与cv2.matchTemplate(TM_CCORR_NORMED)的一致性。
+
+在项目根目录运行: python -m unittest source.test.test_match_norm
+"""
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from source.interaction.fft_match import FFTMatcher
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class MatchNormTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        img = cv2.resize(cv2.imread(os.path.join(TEST_DIR, 'source.png')), (960, 540))
+        # 含纯黑区域，检查窗口能量为0时的处理
+        img[:100, :150] = 0
+        cls.img = img
+        rng = np.random.default_rng(0)
+        cls.templates = []
+        for (w, h) in [(24, 24), (48, 32), (48, 32), (96, 64)]:
+            x, y = int(rng.integers(0, 960 - w)), int(rng.integers(0, 540 - h))
+            cls.templates.append(img[y:y + h, x:x + w].copy())
+        cls.templates.append(img[50:82, 50:98].copy())
+        # 一排同样大小的模板，共用同一个窗口能量
+        cls.group = []
+        for _ in range(4):
+            x, y = int(rng.integers(0, 960 - 48)), int(rng.integers(0, 540 - 32))
+            cls.group.append(img[y:y + 32, x:x + 48].copy())
+
+    def _region(self, is_gray):
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY) if is_gray else self.img
+
+    @staticmethod
+    def _template(template, is_gray):
+        return cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if is_gray else template
+
+    def _check(self, matcher, region, template, method, max_error, mask=None):
+        expect = cv2.matchTemplate(region, template, cv2.TM_CCORR_NORMED, mask=mask)
+        np.nan_to_num(expect, copy=False, nan=0, posinf=0, neginf=0)
+        res = matcher.match_template(region, template, method=method, mask=mask, img_key=('region', region.ndim))
+        np.testing.assert_allclose(res, expect, rtol=0, atol=max_error)
+        self.assertEqual(cv2.minMaxLoc(res)[3], cv2.minMaxLoc(expect)[3])
+
+    def test_spatial_and_fft(self):
+        for is_gray in [False, True]:
+            region = self._region(is_gray)
+            matcher = FFTMatcher()
+            for template in self.templates:
+                for method in ['spatial', 'fft']:
+                    with self.subTest(gray=is_gray, size=template.shape[:2], method=method):
+                        self._check(matcher, region, self._template(template, is_gray), method,
+                                    FFTMatcher.MAX_ERROR)
+
+    def test_shared_norm(self):
+        # 同一区域上多个同样大小的模板，第二个起使用共享的窗口能量
+        for is_gray in [False, True]:
+            region = self._region(is_gray)
+            matcher = FFTMatcher()
+            for i, template in enumerate(self.group):
+                with self.subTest(gray=is_gray, index=i):
+                    self._check(matcher, region, self._template(template, is_gray), 'spatial', FFTMatcher.MAX_ERROR)
+
+    def test_masked_fft(self):
+        # 只用模板中的椭圆区域，模板中掩码外的像素置0
+        for is_gray in [False, True]:
+            region = self._region(is_gray)
+            matcher = FFTMatcher()
+            for template in self.templates[:4]:
+                template = self._template(template, is_gray)
+                h, w = template.shape[:2]
+                mask = np.zeros((h, w), dtype='uint8')
+                cv2.ellipse(mask, (w // 2, h // 2), (w // 2, h // 2), 0, 0, 360, 255, -1)
+                template = cv2.bitwise_and(template, template, mask=mask)
+                with self.subTest(gray=is_gray, size=(h, w)):
+                    self._check(matcher, region, template, 'fft', FFTMatcher.MAX_MASK_ERROR, mask)
+
+
+if __name__ == '__main__':
+    unittest.main()
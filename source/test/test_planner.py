@@ -0,0 +1,53 @@
+"""DetectorPlanner耗时统计的测试，使用回放后端。
+
+在项目根目录运行: python -m unittest source.test.test_planner
+"""
+import os
+import unittest
+
+import cv2
+
+from source.interaction.interaction_core import InteractionBGD
+from source.interaction.planner import DetectorPlanner
+from source.manager.img_manager import ImgIcon
+
+TEST_DIR = os.path.dirname(__file__)
+SOURCE = os.path.join(TEST_DIR, 's20230802150611.jpg')
+
+
+class PlannerCostTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(TEST_DIR, '__planner_icon.png')
+        cv2.imwrite(path, cv2.imread(SOURCE)[200:240, 300:360])
+        try:
+            cls.icon = ImgIcon(path=path, name='planner_icon', cap_posi=[250, 150, 500, 400], jpgmode=0)
+        finally:
+            os.remove(path)
+
+    def _timed(self, planner):
+        checks, hits, timed, total = planner.stats[(self.icon.name, None)]
+        return checks, timed
+
+    def test_memo_hit_not_timed(self):
+        # 回放帧率为1，两次检查在同一帧内，第二次直接使用本帧的结果
+        itt = InteractionBGD(capture_backend='replay', source=SOURCE, fps=1)
+        planner = DetectorPlanner(itt)
+        self.assertTrue(planner.check(self.icon)[0])
+        self.assertTrue(planner.check(self.icon)[0])
+        self.assertEqual(self._timed(planner), (2, 1))
+
+    def test_reuse_hit_not_timed(self):
+        # 每次检查都是新的一帧，但搜索区域没有变化，复用上次的结果
+        itt = InteractionBGD(capture_backend='replay', source=SOURCE)
+        itt.reuse_unchanged_match = True
+        planner = DetectorPlanner(itt)
+        self.assertTrue(planner.check(self.icon)[0])
+        self.assertTrue(planner.check(self.icon)[0])
+        self.assertEqual(itt.match_counters()['reuse_times'], 1)
+        self.assertEqual(self._timed(planner), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Watcher的匹配频率测试，使用回放后端。
+
+在项目根目录运行: python -m unittest source.test.test_watcher
+"""
+import os
+import time
+import unittest
+
+import cv2
+
+from source.interaction.interaction_core import InteractionBGD
+from source.interaction.watcher import Watcher
+from source.manager.img_manager import ImgIcon
+
+TEST_DIR = os.path.dirname(__file__)
+SOURCE = os.path.join(TEST_DIR, 's20230802150611.jpg')
+
+
+class WatcherRateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(TEST_DIR, '__watcher_icon.png')
+        cv2.imwrite(path, cv2.imread(SOURCE)[200:240, 300:360])
+        try:
+            cls.icon = ImgIcon(path=path, name='watcher_icon', cap_posi=[250, 150, 500, 400], jpgmode=0)
+        finally:
+            os.remove(path)
+
+    def _evaluate_rate(self, watcher, duration=1.5):
+        events = []
+        watcher.watch(self.icon, events.append, repeat=True)
+        watcher.start()
+        try:
+            time.sleep(0.2)
+            start, t = watcher.frames_evaluated, time.time()
+            time.sleep(duration)
+            rate = (watcher.frames_evaluated - start) / (time.time() - t)
+        finally:
+            watcher.stop()
+        self.assertTrue(events)
+        return rate
+
+    def test_rate_bounded_by_fps(self):
+        itt = InteractionBGD(capture_backend='replay', source=SOURCE, fps=20)
+        rate = self._evaluate_rate(Watcher(itt))
+        self.assertLessEqual(rate, 20 * 1.1)
+        self.assertGreater(rate, 20 / 2)
+
+    def test_rate_bounded_by_interval(self):
+        itt = InteractionBGD(capture_backend='replay', source=SOURCE, fps=20)
+        rate = self._evaluate_rate(Watcher(itt, interval=0.2))
+        self.assertLessEqual(rate, 5 * 1.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,11 +13,25 @@ import numpy as np
 import pickle
 import psutil
 import traceback
-import win32gui
-import win32process
 import yaml
 from PIL import Image, ImageDraw, ImageFont
 from loguru import logger
+from functools import partialmethod
+
+# 鼠标键盘操作的日志级别，logger.demo(...)
+try:
+    logger.level('DEMO')
+except ValueError:
+    logger.level('DEMO', no=25, color='<cyan>')
+logger.__class__.demo = partialmethod(logger.__class__.log, 'DEMO')
+
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    # 非Windows环境(如回放截图的性能测试机)没有pywin32
+    win32gui = None
+    win32process = None
 
 ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SOURCE_PATH = ROOT_PATH + '\\source'